@@ -0,0 +1,235 @@
+"""Async read path for the hottest GETs, routed when ASYNC_READ_VIEWS is on.
+
+Recipe list and detail, ingredient autocomplete and task status are
+served on the event loop. Rows come from ``aiterator``/``aget`` with
+everything the serializers read already prefetched or annotated, so
+``RecipeReadSerializer`` runs inline without touching the database
+(a stray query would raise ``SynchronousOnlyOperation``). Redis is
+reached through ``redis.asyncio``; anonymous responses share their
+cache entries with the sync views.
+
+Writes, cursor pagination, the browsable API and anything the async
+path cannot authenticate fall through to the sync DRF views, which
+remain the reference behaviour.
+"""
+from functools import partial
+from math import ceil
+
+import orjson
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from recipes.models import Recipe
+
+from .autocomplete import ingredient_index
+from .cache import acached_data, response_cache_key
+from .filters import RecipeFilter
+from .pagination import LimitOrCursorPagination
+from .serializers import RecipeReadSerializer
+from .task_status import aget_task_payload, parse_wait
+from .views import IngredientViewSet, RecipeViewSet, get_task_status
+
+recipe_list_view = RecipeViewSet.as_view(
+    {'get': 'list', 'post': 'create'},
+    basename='recipes', detail=False, suffix='List',
+)
+recipe_detail_view = RecipeViewSet.as_view(
+    {
+        'get': 'retrieve',
+        'put': 'update',
+        'patch': 'partial_update',
+        'delete': 'destroy',
+    },
+    basename='recipes', detail=True, suffix='Instance',
+)
+ingredient_list_view = IngredientViewSet.as_view(
+    {'get': 'list'}, basename='ingredients', detail=False, suffix='List',
+)
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(
+        orjson.dumps(data, default=str),
+        content_type='application/json',
+        status=status_code,
+    )
+
+
+def is_async_read(request):
+    return (
+        request.method == 'GET'
+        and 'format' not in request.GET
+        and 'text/html' not in request.headers.get('Accept', '')
+    )
+
+
+async def fallback(view, request, **kwargs):
+    return await sync_to_async(view)(request, **kwargs)
+
+
+async def aget_user(request):
+    """Mirrors TokenAuthentication; None leaves the answer to DRF."""
+    header = request.headers.get('Authorization')
+    if header is None:
+        return AnonymousUser()
+    parts = header.split()
+    if len(parts) != 2 or parts[0].lower() != 'token':
+        return None
+    try:
+        token = await Token.objects.select_related('user').aget(key=parts[1])
+    except Token.DoesNotExist:
+        return None
+    return token.user if token.user.is_active else None
+
+
+def make_drf_request(request, user):
+    drf_request = Request(request)
+    drf_request.user = user
+    return drf_request
+
+
+def get_page_size(request):
+    default = settings.REST_FRAMEWORK['PAGE_SIZE']
+    try:
+        size = int(
+            request.GET[LimitOrCursorPagination.page_size_query_param]
+        )
+    except (KeyError, ValueError):
+        return default
+    if size <= 0:
+        return default
+    return min(size, LimitOrCursorPagination.max_page_size)
+
+
+async def build_recipe_page(request, queryset):
+    page_size = get_page_size(request)
+    count = await queryset.acount()
+    pages = max(ceil(count / page_size), 1)
+    number = request.GET.get('page', 1)
+    if number in LimitOrCursorPagination.last_page_strings:
+        number = pages
+    try:
+        number = int(number)
+    except ValueError:
+        number = 0
+    if not 1 <= number <= pages:
+        return status.HTTP_404_NOT_FOUND, {
+            'detail': LimitOrCursorPagination.invalid_page_message
+        }
+
+    offset = (number - 1) * page_size
+    recipes = [
+        recipe async for recipe in queryset[
+            offset:offset + page_size
+        ].aiterator(chunk_size=page_size)
+    ]
+    url = request.build_absolute_uri()
+    next_url = previous_url = None
+    if number < pages:
+        next_url = replace_query_param(url, 'page', number + 1)
+    if number == 2:
+        previous_url = remove_query_param(url, 'page')
+    elif number > 2:
+        previous_url = replace_query_param(url, 'page', number - 1)
+    return status.HTTP_200_OK, {
+        'count': count,
+        'next': next_url,
+        'previous': previous_url,
+        'results': RecipeReadSerializer(
+            recipes, many=True, context={'request': request}
+        ).data,
+    }
+
+
+async def build_recipe_detail(request, pk):
+    try:
+        recipe = await Recipe.objects.with_related().with_user_flags(
+            request.user
+        ).aget(pk=pk)
+    except Recipe.DoesNotExist:
+        return status.HTTP_404_NOT_FOUND, {
+            'detail': exceptions.NotFound.default_detail
+        }
+    return status.HTTP_200_OK, RecipeReadSerializer(
+        recipe, context={'request': request}
+    ).data
+
+
+@csrf_exempt
+async def recipe_list(request):
+    if (
+        not is_async_read(request)
+        or LimitOrCursorPagination.cursor_query_param in request.GET
+    ):
+        return await fallback(recipe_list_view, request)
+    user = await aget_user(request)
+    if user is None:
+        return await fallback(recipe_list_view, request)
+    drf_request = make_drf_request(request, user)
+    filterset = RecipeFilter(
+        request.GET,
+        queryset=Recipe.objects.with_related().with_user_flags(user),
+        request=drf_request,
+    )
+    if not filterset.is_valid():
+        return await fallback(recipe_list_view, request)
+
+    build = partial(build_recipe_page, drf_request, filterset.qs)
+    if user.is_authenticated:
+        response_status, data = await build()
+    else:
+        response_status, data = await acached_data(
+            response_cache_key(request, 'recipes', 'list'),
+            ('recipes',), build,
+        )
+    return json_response(data, response_status)
+
+
+@csrf_exempt
+async def recipe_detail(request, pk):
+    if not is_async_read(request):
+        return await fallback(recipe_detail_view, request, pk=pk)
+    user = await aget_user(request)
+    if user is None:
+        return await fallback(recipe_detail_view, request, pk=pk)
+
+    build = partial(build_recipe_detail, make_drf_request(request, user), pk)
+    if user.is_authenticated:
+        response_status, data = await build()
+    else:
+        response_status, data = await acached_data(
+            response_cache_key(request, 'recipes', 'retrieve', pk=pk),
+            ('recipes',), build,
+        )
+    return json_response(data, response_status)
+
+
+@csrf_exempt
+async def ingredient_list(request):
+    name = request.GET.get('name')
+    if not name or not is_async_read(request):
+        return await fallback(ingredient_list_view, request)
+    if await aget_user(request) is None:
+        return await fallback(ingredient_list_view, request)
+    limit = request.GET.get('limit')
+    return json_response(await ingredient_index.asearch(
+        name,
+        limit=int(limit) if limit and limit.isdigit() else None,
+        contains=request.GET.get('contains') not in ('0', 'false'),
+    ))
+
+
+@csrf_exempt
+async def task_status(request, task_id):
+    if not is_async_read(request):
+        return await fallback(get_task_status, request, task_id=task_id)
+    return json_response(
+        await aget_task_payload(task_id, parse_wait(request.GET))
+    )
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+from bisect import bisect_left, bisect_right
+
+from redis.exceptions import RedisError
+
+from recipes.models import Ingredient
+
+from .cache import async_redis_client, redis_client
+
+MAX_CHAR = chr(0x10FFFF)
+
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._async_lock = asyncio.Lock()
+        self._built = False
+        self._version = None
+        self._snapshot = ([], [])
+
+    def _get_version(self):
+        try:
+            return redis_client.get_versions('ingredients')['ingredients']
+        except RedisError:
+            return self._version
+
+    def _ensure_fresh(self):
+        version = self._get_version()
+        if self._built and version == self._version:
+            return
+        with self._lock:
+            if not self._built or version != self._version:
+                self._rebuild()
+                self._version = version
+                self._built = True
+
+    async def _aget_version(self):
+        try:
+            versions = await async_redis_client.get_versions('ingredients')
+        except RedisError:
+            return self._version
+        return versions['ingredients']
+
+    async def _aensure_fresh(self):
+        version = await self._aget_version()
+        if self._built and version == self._version:
+            return
+        async with self._async_lock:
+            if not self._built or version != self._version:
+                self._set_snapshot([
+                    row async for row in self._get_rows().aiterator()
+                ])
+                self._version = version
+                self._built = True
+
+    def _get_rows(self):
+        return Ingredient.objects.order_by().values(
+            'id', 'name', 'measurement_unit'
+        )
+
+    def _rebuild(self):
+        self._set_snapshot(self._get_rows())
+
+    def _set_snapshot(self, rows):
+        rows = sorted(rows, key=lambda row: (row['name'].lower(), row['id']))
+        self._snapshot = ([row['name'].lower() for row in rows], rows)
+
+    def search(self, query, limit=None, contains=True):
+        self._ensure_fresh()
+        return self._search(query, limit, contains)
+
+    async def asearch(self, query, limit=None, contains=True):
+        await self._aensure_fresh()
+        return self._search(query, limit, contains)
+
+    def _search(self, query, limit, contains):
+        # Prefix matches first, in name order, then substring matches.
+        keys, items = self._snapshot
+        query = query.lower()
+        start = bisect_left(keys, query)
+        end = bisect_right(keys, query + MAX_CHAR, lo=start)
+        results = items[start:end]
+        if limit is not None:
+            results = results[:limit]
+        if contains and (limit is None or len(results) < limit):
+            for index, key in enumerate(keys):
+                if limit is not None and len(results) >= limit:
+                    break
+                if query in key and not start <= index < end:
+                    results.append(items[index])
+        return results
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,107 @@
+from urllib.parse import urlencode
+
+from redis.exceptions import RedisError
+from rest_framework import status
+from rest_framework.response import Response
+
+from services.redis import AsyncRedis, Redis
+
+RESPONSE_CACHE_TTL = 300
+
+redis_client = Redis()
+async_redis_client = AsyncRedis()
+
+
+def response_cache_key(request, basename, action, pk=''):
+    query = urlencode(sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        for value in values
+    ))
+    return redis_client.make_cache_key(
+        f"view:{basename}:{action}",
+        host=request.get_host(),
+        pk=pk,
+        query=query,
+    )
+
+
+class AnonymousResponseCacheMixin:
+    cache_resources = ()
+    cache_ttl = RESPONSE_CACHE_TTL
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_response_cache_key(self, request):
+        return response_cache_key(
+            request, self.basename, self.action,
+            pk=self.kwargs.get(self.lookup_field, ''),
+        )
+
+    def cached_response(self, view, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+
+        cache_key = self.get_response_cache_key(request)
+        try:
+            # Version counters and the payload come back in one MGET;
+            # an entry written under older versions counts as a miss.
+            versions, cached = redis_client.get_versioned(
+                cache_key, self.cache_resources
+            )
+        except RedisError:
+            return view(request, *args, **kwargs)
+        if cached is not None and cached['versions'] == versions:
+            return Response(cached['data'])
+
+        response = view(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            try:
+                redis_client.cache_set(
+                    cache_key,
+                    {'versions': versions, 'data': response.data},
+                    ttl=self.cache_ttl
+                )
+            except RedisError:
+                pass
+        return response
+
+
+async def acached_data(cache_key, resources, build, ttl=RESPONSE_CACHE_TTL):
+    """Async twin of ``cached_response`` for anonymous reads.
+
+    ``build`` is a coroutine function returning ``(status, data)``; the
+    entries are shared with the sync views.
+    """
+    try:
+        versions, cached = await async_redis_client.get_versioned(
+            cache_key, resources
+        )
+    except RedisError:
+        return await build()
+    if cached is not None and cached['versions'] == versions:
+        return status.HTTP_200_OK, cached['data']
+
+    response_status, data = await build()
+    if response_status == status.HTTP_200_OK:
+        try:
+            await async_redis_client.cache_set(
+                cache_key, {'versions': versions, 'data': data}, ttl=ttl
+            )
+        except RedisError:
+            pass
+    return response_status, data
+
+
+def bump_cache_version(*resources):
+    for resource in resources:
+        try:
+            redis_client.bump_version(resource)
+        except RedisError:
+            pass
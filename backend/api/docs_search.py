@@ -0,0 +1,56 @@
+import re
+
+from redis.commands.search.query import Query
+
+from .cache import redis_client
+
+DOCS_INDEX = 'idx_docs'
+DOC_SOURCES = ('library', 'bible')
+DOC_FIELDS = ('source', 'author', 'top_work', 'verse', 'timestamp')
+HIGHLIGHT_FIELDS = ['author', 'top_work', 'verse']
+HIGHLIGHT_TAGS = ['<b>', '</b>']
+SEARCH_CACHE_TTL = 60
+SPECIAL_CHARACTERS = re.compile(r'([,.<>{}\[\]"\':;!@#$%^&*()\-+=~|/\\])')
+
+
+def escape_term(term):
+    return SPECIAL_CHARACTERS.sub(r'\\\1', term)
+
+
+def build_query_string(text, source=None):
+    terms = [escape_term(term) for term in text.split()]
+    parts = [' '.join(terms)] if terms else []
+    if source:
+        parts.append(f'@source:{{{source}}}')
+    return ' '.join(parts) or '*'
+
+
+def search_docs(text, source=None, offset=0, limit=10):
+    cache_key = redis_client.make_cache_key(
+        'docs_search', q=text, source=source or '',
+        offset=offset, limit=limit
+    )
+    versions, cached = redis_client.get_versioned(cache_key, ('docs',))
+    if cached is not None and cached['versions'] == versions:
+        return cached['data']
+
+    query = Query(build_query_string(text, source)).paging(
+        offset, limit
+    ).return_fields(*DOC_FIELDS)
+    if text.strip():
+        query = query.highlight(HIGHLIGHT_FIELDS, HIGHLIGHT_TAGS)
+    result = redis_client.redis.ft(DOCS_INDEX).search(query)
+    data = {
+        'count': result.total,
+        'results': [
+            {'id': doc.id, **{
+                field: getattr(doc, field, None) for field in DOC_FIELDS
+            }}
+            for doc in result.docs
+        ],
+    }
+    redis_client.cache_set(
+        cache_key, {'versions': versions, 'data': data},
+        ttl=SEARCH_CACHE_TTL
+    )
+    return data
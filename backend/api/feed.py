@@ -0,0 +1,127 @@
+from redis.exceptions import RedisError
+
+from recipes.models import Recipe
+from users.models import Subscription
+
+from .cache import redis_client
+
+FEED_MAX_LENGTH = 1000
+FEED_BACKFILL_LENGTH = 100
+# Authors with more followers than this are merged into feeds on read.
+FEED_FANOUT_LIMIT = 10000
+# An empty feed keeps a placeholder member, scored below every recipe id,
+# so reads find the key instead of rebuilding it each time. The TTL lets
+# it be rebuilt from the database now and then.
+EMPTY_FEED_MARKER = 'empty'
+EMPTY_FEED_TTL = 60 * 60
+# Pushes only into feeds that exist: a missing feed is rebuilt in full
+# on read, and creating it here would hide every other author's recipes.
+PUSH_TO_EXISTING_FEEDS = '''
+local trim = -tonumber(ARGV[1]) - 1
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        redis.call('ZADD', key, unpack(ARGV, 2))
+        redis.call('ZREMRANGEBYRANK', key, 0, trim)
+    end
+end
+'''
+push_to_existing_feeds = redis_client.redis.register_script(
+    PUSH_TO_EXISTING_FEEDS
+)
+
+
+def feed_key(user_id):
+    return f'feed:{user_id}'
+
+
+def add_to_feeds(user_ids, recipes):
+    args = [item for recipe_id in recipes for item in (recipe_id, recipe_id)]
+    if not args or not user_ids:
+        return
+    push_to_existing_feeds(
+        keys=[feed_key(user_id) for user_id in user_ids],
+        args=[FEED_MAX_LENGTH, *args],
+    )
+
+
+def fan_out_recipe(recipe_id, author_id, chunk_size=1000):
+    followers = Subscription.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True).iterator(chunk_size=chunk_size)
+    chunk = []
+    for user_id in followers:
+        chunk.append(user_id)
+        if len(chunk) >= chunk_size:
+            add_to_feeds(chunk, [recipe_id])
+            chunk = []
+    add_to_feeds(chunk, [recipe_id])
+
+
+def backfill_author(user_id, author_id):
+    if not redis_client.redis.exists(feed_key(user_id)):
+        rebuild_feed(user_id)
+        return
+    add_to_feeds([user_id], Recipe.objects.filter(
+        author_id=author_id
+    ).order_by('-id').values_list('id', flat=True)[:FEED_BACKFILL_LENGTH])
+
+
+def remove_author(user_id, author_id):
+    recipe_ids = list(Recipe.objects.filter(
+        author_id=author_id
+    ).order_by('-id').values_list('id', flat=True)[:FEED_MAX_LENGTH])
+    if recipe_ids:
+        redis_client.redis.zrem(feed_key(user_id), *recipe_ids)
+
+
+def pushed_authors(user_id):
+    return Subscription.objects.filter(
+        user_id=user_id, author__subscribers_count__lte=FEED_FANOUT_LIMIT
+    ).values('author_id')
+
+
+def pulled_authors(user_id):
+    return Subscription.objects.filter(
+        user_id=user_id, author__subscribers_count__gt=FEED_FANOUT_LIMIT
+    ).values('author_id')
+
+
+def rebuild_feed(user_id):
+    key = feed_key(user_id)
+    recipe_ids = Recipe.objects.filter(
+        author_id__in=pushed_authors(user_id)
+    ).order_by('-id').values_list('id', flat=True)[:FEED_MAX_LENGTH]
+    pipe = redis_client.redis.pipeline()
+    pipe.delete(key)
+    if recipe_ids:
+        pipe.zadd(key, {str(recipe_id): recipe_id for recipe_id in recipe_ids})
+    else:
+        pipe.zadd(key, {EMPTY_FEED_MARKER: 0})
+        pipe.expire(key, EMPTY_FEED_TTL)
+    pipe.execute()
+
+
+def get_feed_ids(user_id, before=None, limit=6):
+    try:
+        key = feed_key(user_id)
+        if not redis_client.redis.exists(key):
+            rebuild_feed(user_id)
+        pushed = [
+            int(recipe_id)
+            for recipe_id in redis_client.redis.zrevrangebyscore(
+                key, f'({before}' if before else '+inf', '(0',
+                start=0, num=limit
+            )
+        ]
+        authors = pulled_authors(user_id)
+    except RedisError:
+        pushed = []
+        authors = Subscription.objects.filter(
+            user_id=user_id
+        ).values('author_id')
+
+    pulled = Recipe.objects.filter(author_id__in=authors)
+    if before:
+        pulled = pulled.filter(id__lt=before)
+    pulled = pulled.order_by('-id').values_list('id', flat=True)[:limit]
+    return sorted(set(pushed) | set(pulled), reverse=True)[:limit]
@@ -1,5 +1,9 @@
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, TrigramSimilarity
+)
+from django.db.models import F, Q
 from django_filters import rest_framework as filters
-from recipes.models import Recipe, Ingredient
+from recipes.models import Recipe, Ingredient, SEARCH_CONFIG
 
 
 class RecipeFilter(filters.FilterSet):
@@ -8,10 +12,14 @@ class RecipeFilter(filters.FilterSet):
         method='filter_is_in_shopping_cart'
     )
     author = filters.NumberFilter(field_name='author__id')
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.OrderingFilter(
+        fields=('favorites_count', 'carts_count', 'id')
+    )
 
     class Meta:
         model = Recipe
-        fields = ['author', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['author', 'is_favorited', 'is_in_shopping_cart', 'search']
 
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
@@ -25,6 +33,17 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(in_carts_of__user=user)
         return queryset
 
+    def filter_search(self, queryset, name, value):
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(
+            Q(search_vector=query) | Q(name__trigram_similar=value)
+        ).annotate(
+            rank=SearchRank(F('search_vector'), query),
+            similarity=TrigramSimilarity('name', value),
+        ).order_by('-rank', '-similarity', '-id')
+
 
 class IngredientFilter(filters.FilterSet):
     name = filters.CharFilter(field_name='name', lookup_expr='istartswith')
@@ -0,0 +1,159 @@
+import base64
+import binascii
+import io
+import math
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image, ImageOps, features
+
+DECODE_CHUNK_SIZE = 64 * 1024
+VARIANT_SIZES = {
+    'small': 320,
+    'medium': 720,
+}
+VARIANT_QUALITY = 80
+BLURHASH_COMPONENTS = (4, 3)
+BASE83 = (
+    '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    'abcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+)
+
+
+def decode_base64_to_file(encoded, name, content_type):
+    upload = TemporaryUploadedFile(name, content_type, 0, None)
+    pending = ''
+    try:
+        for start in range(0, len(encoded), DECODE_CHUNK_SIZE):
+            # Data URIs may be wrapped (MIME base64 breaks lines at 76);
+            # whitespace is dropped and the rest must still be base64.
+            pending += ''.join(
+                encoded[start:start + DECODE_CHUNK_SIZE].split()
+            )
+            aligned = len(pending) - len(pending) % 4
+            upload.write(base64.b64decode(pending[:aligned], validate=True))
+            pending = pending[aligned:]
+        upload.write(base64.b64decode(pending, validate=True))
+    except (binascii.Error, ValueError):
+        upload.close()
+        raise
+    upload.size = upload.tell()
+    upload.seek(0)
+    return upload
+
+
+def get_variant_formats():
+    return [fmt for fmt in ('webp', 'avif') if features.check(fmt)]
+
+
+def encode_base83(value, length):
+    return ''.join(
+        BASE83[value // 83 ** (length - index - 1) % 83]
+        for index in range(length)
+    )
+
+
+def srgb_to_linear(value):
+    value /= 255
+    if value <= 0.04045:
+        return value / 12.92
+    return ((value + 0.055) / 1.055) ** 2.4
+
+
+def linear_to_srgb(value):
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def encode_blurhash(image, x_components=BLURHASH_COMPONENTS[0],
+                    y_components=BLURHASH_COMPONENTS[1]):
+    image = image.convert('RGB')
+    image.thumbnail((32, 32))
+    width, height = image.size
+    pixels = [
+        tuple(srgb_to_linear(channel) for channel in pixel)
+        for pixel in image.getdata()
+    ]
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == j == 0 else 2
+            red = green = blue = 0.0
+            for y in range(height):
+                basis_y = math.cos(math.pi * j * y / height)
+                for x in range(width):
+                    basis = (
+                        normalisation * basis_y
+                        * math.cos(math.pi * i * x / width)
+                    )
+                    pixel = pixels[y * width + x]
+                    red += basis * pixel[0]
+                    green += basis * pixel[1]
+                    blue += basis * pixel[2]
+            scale = 1 / (width * height)
+            factors.append((red * scale, green * scale, blue * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = encode_base83((x_components - 1) + (y_components - 1) * 9, 1)
+    max_value = 1.0
+    if ac:
+        actual_max = max(abs(channel) for factor in ac for channel in factor)
+        quantised_max = max(0, min(82, math.floor(actual_max * 166 - 0.5)))
+        max_value = (quantised_max + 1) / 166
+        result += encode_base83(quantised_max, 1)
+    else:
+        result += encode_base83(0, 1)
+    result += encode_base83(
+        (linear_to_srgb(dc[0]) << 16)
+        + (linear_to_srgb(dc[1]) << 8)
+        + linear_to_srgb(dc[2]),
+        4
+    )
+    for factor in ac:
+        quantised = [
+            max(0, min(18, math.floor(
+                math.copysign(abs(channel / max_value) ** 0.5, channel)
+                * 9 + 9.5
+            )))
+            for channel in factor
+        ]
+        result += encode_base83(
+            quantised[0] * 19 * 19 + quantised[1] * 19 + quantised[2], 2
+        )
+    return result
+
+
+def build_variants(field_file):
+    storage = field_file.storage
+    directory, filename = os.path.split(field_file.name)
+    stem = os.path.splitext(filename)[0]
+    formats = get_variant_formats()
+    with field_file.open('rb'), Image.open(field_file) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        variants = {'blurhash': encode_blurhash(image)}
+        for size_name, width in VARIANT_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((width, width * 4))
+            variants[size_name] = {}
+            for fmt in formats:
+                buffer = io.BytesIO()
+                resized.save(buffer, fmt.upper(), quality=VARIANT_QUALITY)
+                variants[size_name][fmt] = storage.save(
+                    f'{directory}/variants/{stem}_{size_name}.{fmt}',
+                    ContentFile(buffer.getvalue())
+                )
+    return variants
+
+
+def get_variant_urls(variants, storage, request):
+    urls = {'blurhash': variants.get('blurhash')}
+    for size_name in VARIANT_SIZES:
+        urls[size_name] = {
+            fmt: request.build_absolute_uri(storage.url(name))
+            for fmt, name in variants.get(size_name, {}).items()
+        }
+    return urls
@@ -0,0 +1,48 @@
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+SUBSCRIBED = 'subscribed'
+FAVORITED = 'favorited'
+IN_CART = 'in_cart'
+
+SOURCES = {
+    SUBSCRIBED: (Subscription, 'author_id'),
+    FAVORITED: (Favorite, 'recipe_id'),
+    IN_CART: (ShoppingCart, 'recipe_id'),
+}
+
+
+class UserStateLoader:
+    def __init__(self, user):
+        self.user = user
+        self._pending = {kind: set() for kind in SOURCES}
+        self._loaded = {kind: set() for kind in SOURCES}
+        self._found = {kind: set() for kind in SOURCES}
+
+    def prime(self, kind, ids):
+        self._pending[kind].update(set(ids) - self._loaded[kind])
+
+    def has(self, kind, obj_id):
+        if not self.user.is_authenticated:
+            return False
+        if obj_id not in self._loaded[kind]:
+            self._pending[kind].add(obj_id)
+            self._load(kind)
+        return obj_id in self._found[kind]
+
+    def _load(self, kind):
+        model, field = SOURCES[kind]
+        ids = self._pending[kind]
+        self._found[kind].update(model.objects.filter(
+            user=self.user, **{f'{field}__in': ids}
+        ).values_list(field, flat=True))
+        self._loaded[kind].update(ids)
+        self._pending[kind] = set()
+
+
+def get_user_state_loader(request):
+    loader = getattr(request, '_user_state_loader', None)
+    if loader is None:
+        loader = UserStateLoader(request.user)
+        request._user_state_loader = loader
+    return loader
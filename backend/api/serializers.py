@@ -1,10 +1,20 @@
 from rest_framework import serializers
 from djoser.serializers import UserCreateSerializer
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
-import base64
+from django.db import transaction
+from django.db import models
+from django.db.models import F
+import binascii
+from functools import partial
 
 from recipes.models import Recipe, Ingredient, IngredientRecipe
+from .cache import bump_cache_version
+from .images import decode_base64_to_file, get_variant_urls
+from .tasks import fan_out_recipe, process_image
+from .loaders import (
+    FAVORITED, IN_CART, SUBSCRIBED, get_user_state_loader
+)
 
 User = get_user_model()
 MIN_AMOUNT = 1
@@ -12,15 +22,70 @@ MAX_AMOUNT = 32000
 
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size} байт.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            max_size = settings.MAX_IMAGE_UPLOAD_SIZE
+            if len(imgstr) * 3 // 4 > max_size:
+                self.fail('too_large', max_size=max_size)
+            try:
+                data = decode_base64_to_file(
+                    imgstr, 'temp.' + ext, format.split(':')[-1]
+                )
+            except (binascii.Error, ValueError):
+                self.fail('invalid_image')
         return super().to_internal_value(data)
 
 
-class CustomUserSerializer(serializers.ModelSerializer):
+class ImageVariantsMixin:
+    image_field_name = 'image'
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        request = self.context.get('request')
+        name = self.image_field_name
+        variants = getattr(instance, f'{name}_variants', None)
+        if request is None or not variants:
+            return data
+        field_file = getattr(instance, name)
+        urls = get_variant_urls(variants, field_file.storage, request)
+        if isinstance(self.parent, serializers.ListSerializer):
+            data[name] = next(iter(urls['medium'].values()), data[name])
+        if request.query_params.get('image_variants') in ('1', 'true'):
+            data[f'{name}_variants'] = urls
+        return data
+
+
+def schedule_image_processing(instance, field_name):
+    transaction.on_commit(partial(
+        process_image.delay,
+        instance._meta.app_label,
+        instance._meta.model_name,
+        instance.pk,
+        field_name,
+    ))
+
+
+class UserStateListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        items = list(data)
+        request = self.context.get('request')
+        if request is not None:
+            self.child.prime_user_state(
+                get_user_state_loader(request), items
+            )
+        return super().to_representation(items)
+
+
+class CustomUserSerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    image_field_name = 'avatar'
     is_subscribed = serializers.SerializerMethodField()
     avatar = Base64ImageField(required=False, allow_null=True)
 
@@ -35,12 +100,25 @@ class CustomUserSerializer(serializers.ModelSerializer):
             "is_subscribed",
             "avatar"
         )
+        list_serializer_class = UserStateListSerializer
+
+    def prime_user_state(self, loader, users):
+        loader.prime(SUBSCRIBED, [user.pk for user in users])
+
+    def update(self, instance, validated_data):
+        if 'avatar' in validated_data:
+            instance.avatar_variants = {}
+        instance = super().update(instance, validated_data)
+        if 'avatar' in validated_data and instance.avatar:
+            schedule_image_processing(instance, 'avatar')
+        return instance
 
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return user.subscriptions.filter(author=obj).exists()
+        subscribed = getattr(obj, 'subscribed', None)
+        if subscribed is not None:
+            return subscribed
+        loader = get_user_state_loader(self.context['request'])
+        return loader.has(SUBSCRIBED, obj.pk)
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -82,7 +160,7 @@ class RecipeIngredientReadSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit", "amount")
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     ingredients = RecipeIngredientReadSerializer(
         source='recipe_ingredients',
@@ -105,18 +183,31 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             "is_favorited",
             "is_in_shopping_cart",
         ]
+        list_serializer_class = UserStateListSerializer
+
+    def prime_user_state(self, loader, recipes):
+        ids = [recipe.pk for recipe in recipes]
+        loader.prime(FAVORITED, ids)
+        loader.prime(IN_CART, ids)
+        loader.prime(SUBSCRIBED, [recipe.author_id for recipe in recipes])
+
+    def to_representation(self, instance):
+        author_subscribed = getattr(instance, 'author_subscribed', None)
+        if author_subscribed is not None:
+            instance.author.subscribed = author_subscribed
+        return super().to_representation(instance)
 
     def get_is_favorited(self, obj):
-        request = self.context.get("request")
-        return request.user.is_authenticated and obj.favorited_by.filter(
-            user=request.user
-        ).exists()
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
+        loader = get_user_state_loader(self.context["request"])
+        return loader.has(FAVORITED, obj.pk)
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context.get("request")
-        return request.user.is_authenticated and obj.in_carts_of.filter(
-            user=request.user
-        ).exists()
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
+        loader = get_user_state_loader(self.context["request"])
+        return loader.has(IN_CART, obj.pk)
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
@@ -157,22 +248,33 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 {"ingredients": "Ингредиенты не должны повторяться."})
         return data
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop("ingredients")
-        recipe = Recipe.objects.create(
-            author=self.context["request"].user, **validated_data
+        author = self.context["request"].user
+        recipe = Recipe.objects.create(author=author, **validated_data)
+        User.objects.filter(pk=author.pk).update(
+            recipes_count=F('recipes_count') + 1
         )
         self._save_ingredients(recipe, ingredients_data)
+        Recipe.objects.filter(pk=recipe.pk).update_search_vector()
+        schedule_image_processing(recipe, 'image')
+        transaction.on_commit(partial(fan_out_recipe.delay, recipe.pk))
         return recipe
 
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop("ingredients", [])
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
+        if 'image' in validated_data:
+            instance.image_variants = {}
         instance.save()
         if ingredients_data:
             instance.recipe_ingredients.all().delete()
             self._save_ingredients(instance, ingredients_data)
+        Recipe.objects.filter(pk=instance.pk).update_search_vector()
+        if 'image' in validated_data:
+            schedule_image_processing(instance, 'image')
         return instance
 
     def _save_ingredients(self, recipe, ingredients_data):
@@ -183,9 +285,11 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 amount=ing["amount"]
             ) for ing in ingredients_data
         ])
+        # bulk_create does not send post_save.
+        bump_cache_version('recipes')
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
@@ -209,23 +313,29 @@ class SubscriptionSerializer(serializers.ModelSerializer):
             'recipes',
             'recipes_count'
         )
+        list_serializer_class = UserStateListSerializer
+
+    def prime_user_state(self, loader, users):
+        loader.prime(SUBSCRIBED, [user.pk for user in users])
 
     def get_is_subscribed(self, obj):
-        request = self.context.get('request')
-        user = getattr(request, 'user', None)
-        if user and user.is_authenticated:
-            return user.subscriptions.filter(author=obj).exists()
-        return False
+        subscribed = getattr(obj, 'subscribed', None)
+        if subscribed is not None:
+            return subscribed
+        loader = get_user_state_loader(self.context['request'])
+        return loader.has(SUBSCRIBED, obj.pk)
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes = obj.recipes.all()
-        recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit and recipes_limit.isdigit():
-            recipes = recipes[:int(recipes_limit)]
+        recipes = getattr(obj, 'limited_recipes', None)
+        if recipes is None:
+            request = self.context.get('request')
+            recipes = obj.recipes.all()
+            recipes_limit = request.query_params.get('recipes_limit')
+            if recipes_limit and recipes_limit.isdigit():
+                recipes = recipes[:int(recipes_limit)]
         return RecipeShortSerializer(
             recipes, many=True, context=self.context
         ).data
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
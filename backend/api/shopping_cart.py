@@ -0,0 +1,99 @@
+import csv
+import io
+import os
+
+from django.db.models import Sum
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import IngredientRecipe
+
+TITLE = 'Список покупок:'
+PDF_FONT_PATH = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+CHUNK_SIZE = 64 * 1024
+
+
+def get_shopping_list(user):
+    return IngredientRecipe.objects.filter(
+        recipe__in_carts_of__user=user
+    ).values(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        total_amount=Sum('amount')
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+def render_txt(items):
+    yield f'{TITLE}\n\n'
+    for item in items:
+        yield (
+            f"{item['ingredient__name']} "
+            f"({item['ingredient__measurement_unit']}) "
+            f"— {item['total_amount']}\n"
+        )
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def render_csv(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['name', 'measurement_unit', 'amount'])
+    for item in items:
+        yield writer.writerow([
+            item['ingredient__name'],
+            item['ingredient__measurement_unit'],
+            item['total_amount'],
+        ])
+
+
+def get_pdf_font():
+    if 'ShoppingCartFont' in pdfmetrics.getRegisteredFontNames():
+        return 'ShoppingCartFont'
+    if os.path.exists(PDF_FONT_PATH):
+        pdfmetrics.registerFont(TTFont('ShoppingCartFont', PDF_FONT_PATH))
+        return 'ShoppingCartFont'
+    return 'Helvetica'
+
+
+def render_pdf(items):
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    font = get_pdf_font()
+    _, height = A4
+    y = height - PDF_MARGIN
+    pdf.setFont(font, PDF_FONT_SIZE)
+    pdf.drawString(PDF_MARGIN, y, TITLE)
+    for item in items:
+        y -= PDF_LINE_HEIGHT
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        pdf.drawString(
+            PDF_MARGIN, y,
+            f"{item['ingredient__name']} "
+            f"({item['ingredient__measurement_unit']}) "
+            f"— {item['total_amount']}"
+        )
+    pdf.save()
+    buffer.seek(0)
+    while chunk := buffer.read(CHUNK_SIZE):
+        yield chunk
+
+
+FORMATS = {
+    'txt': ('text/plain; charset=utf-8', render_txt),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'pdf': ('application/pdf', render_pdf),
+}
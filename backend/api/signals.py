@@ -0,0 +1,54 @@
+from celery.signals import task_postrun, task_prerun
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from redis.exceptions import RedisError
+
+from recipes.models import Ingredient, IngredientRecipe, Recipe
+from services.profiling import finish_task_profile, start_task_profile
+from users.models import User
+
+from .cache import bump_cache_version, redis_client
+from .task_status import task_status_channel
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=IngredientRecipe)
+def invalidate_recipes(sender, **kwargs):
+    bump_cache_version('recipes')
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    bump_cache_version('ingredients', 'recipes')
+
+
+@receiver(post_save, sender=User)
+def invalidate_recipe_authors(sender, update_fields=None, **kwargs):
+    # Cached recipe pages embed the author; logins only touch last_login.
+    if update_fields is None or set(update_fields) - {'last_login'}:
+        bump_cache_version('recipes')
+
+
+@receiver(post_save, sender=Ingredient)
+def update_recipe_search_vector(sender, instance, created, **kwargs):
+    if not created:
+        Recipe.objects.filter(ingredients=instance).update_search_vector()
+
+
+@task_postrun.connect
+def publish_task_status(task_id=None, state=None, **kwargs):
+    try:
+        redis_client.redis.publish(task_status_channel(task_id), state)
+    except RedisError:
+        pass
+
+
+@task_prerun.connect
+def start_profile(task_id=None, task=None, **kwargs):
+    if task.name.startswith('api.tasks.'):
+        start_task_profile(task_id, task.name)
+
+
+@task_postrun.connect
+def finish_profile(task_id=None, task=None, **kwargs):
+    finish_task_profile(task_id, task.name)
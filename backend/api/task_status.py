@@ -0,0 +1,116 @@
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from celery import states
+from celery.result import AsyncResult
+
+from services.redis import AsyncRedis, Redis
+
+MAX_WAIT = 30
+# A WSGI worker is held for the whole wait, so sync waits are shorter.
+SYNC_MAX_WAIT = 10
+EVENTS_TIMEOUT = 300
+HEARTBEAT_INTERVAL = 15
+
+
+def task_status_channel(task_id):
+    return f'task-status:{task_id}'
+
+
+def parse_wait(params):
+    try:
+        return max(float(params.get('wait', 0)), 0)
+    except ValueError:
+        return 0
+
+
+def get_task_payload(task_id):
+    result = AsyncResult(task_id)
+    payload = {
+        'task_id': task_id,
+        'status': result.status,
+        'result': None,
+    }
+    if result.successful():
+        payload['result'] = result.result
+    elif result.failed():
+        payload['result'] = repr(result.result)
+    return payload
+
+
+def wait_for_task_payload(task_id, wait):
+    """Long-polls on the task's status channel, blocking the thread."""
+    pubsub = Redis().pubsub()
+    pubsub.subscribe(task_status_channel(task_id))
+    try:
+        payload = get_task_payload(task_id)
+        if payload['status'] in states.READY_STATES:
+            return payload
+        deadline = time.monotonic() + min(wait, SYNC_MAX_WAIT)
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=remaining
+            )
+            if message is not None:
+                break
+        return get_task_payload(task_id)
+    finally:
+        pubsub.close()
+
+
+async def aget_task_payload(task_id, wait=0):
+    """Long-polls on the task's status channel instead of a thread."""
+    get_payload = sync_to_async(get_task_payload)
+    if not wait:
+        return await get_payload(task_id)
+    pubsub = AsyncRedis().pubsub()
+    await pubsub.subscribe(task_status_channel(task_id))
+    try:
+        payload = await get_payload(task_id)
+        if payload['status'] in states.READY_STATES:
+            return payload
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(wait, MAX_WAIT)
+        while (remaining := deadline - loop.time()) > 0:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=remaining
+            )
+            if message is not None:
+                break
+        return await get_payload(task_id)
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+
+
+def format_event(payload):
+    return f'event: status\ndata: {json.dumps(payload)}\n\n'
+
+
+async def stream_task_events(task_id, timeout=EVENTS_TIMEOUT):
+    pubsub = AsyncRedis().pubsub()
+    await pubsub.subscribe(task_status_channel(task_id))
+    try:
+        # Subscribe before the first read so a completion that happens
+        # in between is not missed.
+        payload = await sync_to_async(get_task_payload)(task_id)
+        yield format_event(payload)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (
+            payload['status'] not in states.READY_STATES
+            and loop.time() < deadline
+        ):
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=HEARTBEAT_INTERVAL
+            )
+            if message is None:
+                yield ': keep-alive\n\n'
+                continue
+            payload = await sync_to_async(get_task_payload)(task_id)
+            yield format_event(payload)
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
@@ -1,27 +1,58 @@
 from celery import shared_task
 import requests
+from django.apps import apps
 from services.redis import Redis
-import uuid
+from recipes.models import Recipe
+from . import feed
+from .cache import bump_cache_version
+from .feed import FEED_FANOUT_LIMIT
+from .images import build_variants
+import hashlib
 from datetime import datetime
+from functools import partial
+
+OPENLIBRARY_URL = "https://openlibrary.org/search/authors.json"
+BIBLE_URL = "https://bible-api.com/data/web/random"
+UPSTREAM_TIMEOUT = (3.05, 10)
+LOOKUP_SOFT_TTL = 3600
+LOOKUP_HARD_TTL = 86400
+EXTERNAL_SOFT_TIME_LIMIT = 20
+EXTERNAL_TIME_LIMIT = 30
+EXTERNAL_RATE_LIMIT = "10/s"
 
 redis_client = Redis()
 
-@shared_task
+
+def doc_key(source, *parts):
+    digest = hashlib.sha1(
+        "|".join(str(part) for part in parts).encode()
+    ).hexdigest()
+    return f"{source}:{digest}"
+
+
+@shared_task(
+    soft_time_limit=EXTERNAL_SOFT_TIME_LIMIT, time_limit=EXTERNAL_TIME_LIMIT,
+    rate_limit=EXTERNAL_RATE_LIMIT
+)
 def get_book(book):
     cache_key = redis_client.make_cache_key("book_author", book=book)
-    cached = redis_client.cache_get(cache_key)
-    if cached:
-        return cached
+    return redis_client.get_or_fetch(
+        cache_key, partial(fetch_book, book),
+        soft_ttl=LOOKUP_SOFT_TTL, hard_ttl=LOOKUP_HARD_TTL
+    )
 
-    url = f"https://openlibrary.org/search/authors.json?q={book}"
-    resp = requests.get(url).json()
 
+def fetch_book(book):
+    resp = requests.get(
+        OPENLIBRARY_URL, params={"q": book}, timeout=UPSTREAM_TIMEOUT
+    ).json()
+
+    redis_client.ensure_index()
     pipe = redis_client.redis.pipeline()
 
     for item in resp["docs"]:
-        key = f"library:{uuid.uuid4()}"
         pipe.hset(
-            key,
+            doc_key("library", item["key"]),
             mapping={
                 "source": "library",
                 "author": item["name"],
@@ -31,31 +62,75 @@ def get_book(book):
         )
 
     pipe.execute()
-    redis_client.cache_set(cache_key, resp)
+    bump_cache_version("docs")
     return resp
 
-@shared_task
+
+@shared_task(
+    soft_time_limit=EXTERNAL_SOFT_TIME_LIMIT, time_limit=EXTERNAL_TIME_LIMIT,
+    rate_limit=EXTERNAL_RATE_LIMIT
+)
 def get_bible_verse():
     cache_key = redis_client.make_cache_key("bible_verse")
-    cached = redis_client.cache_get(cache_key)
-    if cached:
-        return cached
+    return redis_client.get_or_fetch(
+        cache_key, fetch_bible_verse,
+        soft_ttl=LOOKUP_SOFT_TTL, hard_ttl=LOOKUP_HARD_TTL
+    )
 
-    url = "https://bible-api.com/data/web/random"
-    resp = requests.get(url).json()
 
+def fetch_bible_verse():
+    resp = requests.get(BIBLE_URL, timeout=UPSTREAM_TIMEOUT).json()
+
+    redis_client.ensure_index()
     pipe = redis_client.redis.pipeline()
 
-    key = f"bible:{uuid.uuid4()}"
+    verse = resp["random_verse"]
     pipe.hset(
-        key,
+        doc_key("bible", verse["book_id"], verse["chapter"], verse["verse"]),
         mapping={
             "source": "bible",
-            "quote": resp["random_verse"]["text"],
+            "quote": verse["text"],
+            "verse": verse["text"],
             "timestamp": datetime.now().isoformat()
         }
     )
 
     pipe.execute()
-    redis_client.cache_set(cache_key, resp)
+    bump_cache_version("docs")
     return resp
+
+
+@shared_task(soft_time_limit=60, time_limit=120)
+def process_image(app_label, model_name, pk, field_name):
+    model = apps.get_model(app_label, model_name)
+    instance = model.objects.filter(pk=pk).first()
+    field_file = getattr(instance, field_name, None)
+    if not field_file:
+        return None
+
+    variants = build_variants(field_file)
+    model.objects.filter(pk=pk, **{field_name: field_file.name}).update(
+        **{f'{field_name}_variants': variants}
+    )
+    bump_cache_version('recipes')
+    return variants
+
+
+@shared_task(soft_time_limit=540, time_limit=600)
+def fan_out_recipe(recipe_id):
+    recipe = Recipe.objects.select_related('author').filter(
+        pk=recipe_id
+    ).first()
+    if recipe is None or recipe.author.subscribers_count > FEED_FANOUT_LIMIT:
+        return
+    feed.fan_out_recipe(recipe.pk, recipe.author_id)
+
+
+@shared_task(time_limit=60)
+def backfill_feed(user_id, author_id):
+    feed.backfill_author(user_id, author_id)
+
+
+@shared_task(time_limit=60)
+def trim_feed(user_id, author_id):
+    feed.remove_author(user_id, author_id)
@@ -0,0 +1,43 @@
+from unittest import mock
+
+from django.test import TestCase
+from redis.exceptions import RedisError
+
+from api import feed
+from users.models import User
+
+
+def redis_available():
+    try:
+        return feed.redis_client.redis.ping()
+    except RedisError:
+        return False
+
+
+class EmptyFeedTests(TestCase):
+    def setUp(self):
+        if not redis_available():
+            self.skipTest('Redis is not available')
+        self.user = User.objects.create(
+            email='reader@example.com', username='reader',
+            first_name='Имя', last_name='Фамилия',
+        )
+        self.key = feed.feed_key(self.user.pk)
+        feed.redis_client.redis.delete(self.key)
+        self.addCleanup(feed.redis_client.redis.delete, self.key)
+
+    def test_empty_feed_is_rebuilt_once(self):
+        with mock.patch.object(
+            feed, 'rebuild_feed', wraps=feed.rebuild_feed
+        ) as rebuild:
+            self.assertEqual(feed.get_feed_ids(self.user.pk), [])
+            self.assertEqual(feed.get_feed_ids(self.user.pk), [])
+
+        rebuild.assert_called_once_with(self.user.pk)
+        self.assertGreater(feed.redis_client.redis.ttl(self.key), 0)
+
+    def test_recipe_pushed_into_empty_feed_is_read(self):
+        feed.get_feed_ids(self.user.pk)
+        feed.add_to_feeds([self.user.pk], [42])
+
+        self.assertEqual(feed.get_feed_ids(self.user.pk), [42])
@@ -0,0 +1,26 @@
+import base64
+import binascii
+import os
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api.images import decode_base64_to_file
+
+
+class DecodeBase64Tests(SimpleTestCase):
+    def decode(self, encoded):
+        upload = decode_base64_to_file(encoded, 'image.png', 'image/png')
+        self.addCleanup(upload.close)
+        return upload.read()
+
+    def test_wrapped_payload_spanning_chunks(self):
+        data = os.urandom(1000)
+        encoded = base64.encodebytes(data).decode().replace('\n', '\r\n')
+
+        with mock.patch('api.images.DECODE_CHUNK_SIZE', 100):
+            self.assertEqual(self.decode(encoded), data)
+
+    def test_invalid_characters_are_rejected(self):
+        with self.assertRaises(binascii.Error):
+            self.decode('aGVsbG8*')
@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.test import SimpleTestCase
+from redis.exceptions import RedisError
+
+from api import tasks
+
+CALLERS = 16
+UPSTREAM_DELAY = 0.3
+
+
+def redis_available():
+    try:
+        return tasks.redis_client.redis.ping()
+    except RedisError:
+        return False
+
+
+class StubUpstream(BaseHTTPRequestHandler):
+    hits = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with StubUpstream.lock:
+            StubUpstream.hits += 1
+        time.sleep(UPSTREAM_DELAY)
+        body = json.dumps({'docs': [{
+            'key': 'OL18319A',
+            'name': 'Mark Twain',
+            'top_work': 'Adventures of Huckleberry Finn',
+        }]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LookupCacheTests(SimpleTestCase):
+    def setUp(self):
+        if not redis_available():
+            self.skipTest('Redis is not available')
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubUpstream)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        StubUpstream.hits = 0
+
+        self.book = f'stub-{time.time_ns()}'
+        self.cache_key = tasks.redis_client.make_cache_key(
+            'book_author', book=self.book
+        )
+        self.addCleanup(
+            tasks.redis_client.redis.delete,
+            self.cache_key, tasks.doc_key('library', 'OL18319A')
+        )
+        patcher = mock.patch.object(
+            tasks, 'OPENLIBRARY_URL',
+            f'http://127.0.0.1:{self.server.server_port}/search/authors.json'
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_misses_fetch_upstream_once(self):
+        with ThreadPoolExecutor(CALLERS) as pool:
+            results = list(pool.map(
+                lambda _: tasks.get_book(self.book), range(CALLERS)
+            ))
+
+        self.assertEqual(StubUpstream.hits, 1)
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(results[0]['docs'][0]['name'], 'Mark Twain')
+
+    def test_repeat_fetch_reuses_document_key(self):
+        first = tasks.fetch_book(self.book)
+        second = tasks.fetch_book(self.book)
+
+        self.assertEqual(StubUpstream.hits, 2)
+        self.assertEqual(first, second)
+        self.assertEqual(
+            tasks.redis_client.redis.hget(
+                tasks.doc_key('library', 'OL18319A'), 'author'
+            ),
+            'Mark Twain'
+        )
+
+    def test_stale_entry_is_served_while_refresh_is_locked(self):
+        tasks.redis_client.cache_set(
+            self.cache_key,
+            {'value': {'docs': []}, 'fresh_until': time.time() - 1}
+        )
+        lock = tasks.redis_client.redis.lock(f'lock:{self.cache_key}')
+        lock.acquire()
+        self.addCleanup(lock.release)
+
+        self.assertEqual(tasks.get_book(self.book), {'docs': []})
+        self.assertEqual(StubUpstream.hits, 0)
+
+    def test_stale_entry_is_served_when_refresh_fails(self):
+        tasks.redis_client.cache_set(
+            self.cache_key,
+            {'value': {'docs': []}, 'fresh_until': time.time() - 1}
+        )
+        fetch = mock.Mock(side_effect=RuntimeError('upstream is down'))
+
+        self.assertEqual(
+            tasks.redis_client.get_or_fetch(self.cache_key, fetch),
+            {'docs': []}
+        )
+        fetch.assert_called_once_with()
+
+    def test_waiter_raises_instead_of_fetching(self):
+        lock = tasks.redis_client.redis.lock(f'lock:{self.cache_key}')
+        lock.acquire()
+        self.addCleanup(lock.release)
+        fetch = mock.Mock()
+
+        with mock.patch('services.redis.LOCK_TIMEOUT', 0.2):
+            with self.assertRaises(LookupError):
+                tasks.redis_client.get_or_fetch(self.cache_key, fetch)
+        fetch.assert_not_called()
+
+    def test_fetch_outliving_the_lock_still_returns(self):
+        def fetch():
+            time.sleep(0.3)
+            return {'docs': []}
+
+        with mock.patch('services.redis.LOCK_TIMEOUT', 0.1):
+            self.assertEqual(
+                tasks.redis_client.get_or_fetch(self.cache_key, fetch),
+                {'docs': []}
+            )
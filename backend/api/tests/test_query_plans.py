@@ -0,0 +1,181 @@
+import json
+import os
+from pathlib import Path
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+
+from recipes.models import (
+    Favorite, Ingredient, IngredientRecipe, Recipe, ShoppingCart
+)
+from users.models import Subscription, User
+
+from api.shopping_cart import get_shopping_list
+
+# Large enough that reading a whole table costs the planner more than
+# an index lookup, so no planner settings need to be forced.
+USERS = 10000
+RECIPES_PER_USER = 2
+INGREDIENTS = 2000
+INGREDIENTS_PER_RECIPE = 5
+FAVORITES_PER_USER = 10
+CART_PER_USER = 5
+SUBSCRIPTIONS_PER_USER = 10
+
+# Expected scans per query: [relation, node type, index]. Regenerate
+# with UPDATE_QUERY_PLANS=1 after a deliberate index or query change
+# and review the diff.
+SNAPSHOT_PATH = Path(__file__).with_name('query_plans.json')
+UPDATE_SNAPSHOT = bool(os.getenv('UPDATE_QUERY_PLANS'))
+SNAPSHOT = json.loads(SNAPSHOT_PATH.read_text(encoding='utf-8'))
+
+
+def walk_plan(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from walk_plan(child)
+
+
+def get_scans(plan):
+    scans = []
+    for node in walk_plan(plan):
+        if 'Relation Name' not in node:
+            continue
+        index = node.get('Index Name')
+        if node['Node Type'] == 'Bitmap Heap Scan':
+            index = ','.join(sorted(
+                child['Index Name'] for child in walk_plan(node)
+                if child['Node Type'] == 'Bitmap Index Scan'
+            ))
+        scans.append([node['Relation Name'], node['Node Type'], index])
+    return sorted(scans)
+
+
+def dump_snapshot(snapshot):
+    """Writes one scan per line so plan changes read well in a diff."""
+    queries = ',\n'.join(
+        f'  {json.dumps(name)}: [\n'
+        + ',\n'.join(f'    {json.dumps(scan)}' for scan in scans)
+        + '\n  ]'
+        for name, scans in snapshot.items()
+    )
+    return f'{{\n{queries}\n}}\n'
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans need Postgres')
+class HotQueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([
+            User(
+                email=f'user{i}@example.com',
+                username=f'user{i}',
+                first_name='Имя',
+                last_name='Фамилия',
+            ) for i in range(USERS)
+        ])
+        ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(INGREDIENTS)
+        ])
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                author=author,
+                name=f'Рецепт {author.pk}-{i}',
+                text='Описание',
+                cooking_time=10,
+            )
+            for author in users for i in range(RECIPES_PER_USER)
+        ])
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(
+                recipe=recipe,
+                ingredient=ingredients[
+                    (recipe.pk * INGREDIENTS_PER_RECIPE + i) % INGREDIENTS
+                ],
+                amount=i + 1,
+            )
+            for recipe in recipes for i in range(INGREDIENTS_PER_RECIPE)
+        ], batch_size=5000)
+        Favorite.objects.bulk_create([
+            Favorite(
+                user=user,
+                recipe=recipes[(number * 37 + i * 211) % len(recipes)],
+            )
+            for number, user in enumerate(users)
+            for i in range(FAVORITES_PER_USER)
+        ])
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(
+                user=user,
+                recipe=recipes[(number * 53 + i * 307) % len(recipes)],
+            )
+            for number, user in enumerate(users)
+            for i in range(CART_PER_USER)
+        ])
+        Subscription.objects.bulk_create([
+            Subscription(user=user, author=users[(number + i) % USERS])
+            for number, user in enumerate(users)
+            for i in range(1, SUBSCRIPTIONS_PER_USER + 1)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user = users[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        if UPDATE_SNAPSHOT:
+            SNAPSHOT_PATH.write_text(dump_snapshot(SNAPSHOT), encoding='utf-8')
+        super().tearDownClass()
+
+    def assertPlanMatches(self, name, queryset):
+        plan = json.loads(queryset.explain(format='json'))[0]['Plan']
+        scans = get_scans(plan)
+        if UPDATE_SNAPSHOT:
+            SNAPSHOT[name] = scans
+        self.assertEqual(
+            scans, SNAPSHOT[name],
+            f'Plan of {name} changed:\n{json.dumps(plan, indent=2)}'
+        )
+
+    def test_recipes_by_author(self):
+        self.assertPlanMatches(
+            'recipes_by_author',
+            Recipe.objects.filter(author=self.user).order_by('-id')[:6],
+        )
+
+    def test_recipes_favorited_by_user(self):
+        self.assertPlanMatches(
+            'recipes_favorited_by_user',
+            Recipe.objects.filter(favorited_by__user=self.user),
+        )
+
+    def test_recipes_in_cart_of_user(self):
+        self.assertPlanMatches(
+            'recipes_in_cart_of_user',
+            Recipe.objects.filter(in_carts_of__user=self.user),
+        )
+
+    def test_recipe_user_flags(self):
+        self.assertPlanMatches(
+            'recipe_user_flags',
+            Recipe.objects.with_related().with_user_flags(self.user)[:6],
+        )
+
+    def test_shopping_cart_aggregation(self):
+        self.assertPlanMatches(
+            'shopping_cart_aggregation', get_shopping_list(self.user)
+        )
+
+    def test_ingredient_prefix_search(self):
+        self.assertPlanMatches(
+            'ingredient_prefix_search',
+            Ingredient.objects.filter(name__istartswith='ингредиент 123'),
+        )
+
+    def test_subscribed_authors(self):
+        self.assertPlanMatches(
+            'subscribed_authors',
+            User.objects.filter(subscribers__user=self.user),
+        )
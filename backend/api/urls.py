@@ -1,7 +1,12 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
-from .views import RecipeViewSet, UserViewSet, IngredientViewSet, run_bible_verse_task, run_book_task, get_task_status
+from . import async_views
+from .views import (
+    RecipeViewSet, UserViewSet, IngredientViewSet, run_bible_verse_task,
+    run_book_task, get_task_status, search_docs_view, task_status_events
+)
 
 app_name = 'api'
 
@@ -19,5 +24,22 @@ urlpatterns = [
 urlpatterns += [
     path('book/', run_book_task, name='book'),
     path('bible_verse/', run_bible_verse_task, name='bible_verse'),
-    path('task_status/<str:task_id>/', get_task_status)
+    path('task_status/<str:task_id>/', get_task_status),
+    path('task_status/<str:task_id>/events/', task_status_events),
+    path('docs/search/', search_docs_view, name='docs-search'),
 ]
+
+if settings.ASYNC_READ_VIEWS:
+    # Ahead of the router, which they fall back to for everything else.
+    urlpatterns = [
+        path('recipes/', async_views.recipe_list, name='recipes-list'),
+        path(
+            'recipes/<int:pk>/', async_views.recipe_detail,
+            name='recipes-detail'
+        ),
+        path(
+            'ingredients/', async_views.ingredient_list,
+            name='ingredients-list'
+        ),
+        path('task_status/<str:task_id>/', async_views.task_status),
+    ] + urlpatterns
@@ -3,20 +3,23 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 from django.shortcuts import get_object_or_404
-from collections import defaultdict
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Window
+from functools import partial
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from redis.exceptions import RedisError
+from django.db.models.functions import RowNumber
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 
 from djoser.views import UserViewSet as DjoserUserViewSet
 from .filters import RecipeFilter, IngredientFilter
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
-from .tasks import get_bible_verse, get_book
-from celery.result import AsyncResult
+from .tasks import backfill_feed, get_bible_verse, get_book, trim_feed
 
-from recipes.models import (
-    Recipe, Ingredient, IngredientRecipe
-)
+from recipes.models import Recipe, Ingredient
 from users.models import User, Subscription
 from .serializers import (
     IngredientSerializer,
@@ -26,12 +29,24 @@ from .serializers import (
     RecipeShortSerializer,
     CustomUserSerializer,
 )
-from .pagination import LimitPageNumberPagination
+from .pagination import LimitOrCursorPagination
 from .permissions import IsAuthorOrReadOnly
+from .cache import AnonymousResponseCacheMixin
+from .autocomplete import ingredient_index
+from .feed import get_feed_ids
+from .docs_search import DOC_SOURCES, search_docs
+from .task_status import (
+    EVENTS_TIMEOUT, get_task_payload, parse_wait, stream_task_events,
+    wait_for_task_payload
+)
+from .shopping_cart import (
+    FORMATS as SHOPPING_CART_FORMATS,
+    get_shopping_list,
+)
 
 
 class UserViewSet(DjoserUserViewSet):
-    pagination_class = LimitPageNumberPagination
+    pagination_class = LimitOrCursorPagination
 
     def get_queryset(self):
         users = User.objects.all()
@@ -42,12 +57,33 @@ class UserViewSet(DjoserUserViewSet):
             return [permissions.AllowAny()]
         return super().get_permissions()
 
+    def get_subscription_queryset(self, queryset):
+        recipes = Recipe.objects.all()
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes.annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F('author_id'),
+                    order_by=F('id').desc(),
+                )
+            ).filter(row_number__lte=int(recipes_limit))
+        return queryset.annotate(
+            subscribed=Exists(Subscription.objects.filter(
+                user=self.request.user, author=OuterRef('pk')
+            )),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
+
     @action(detail=False, methods=['get'],
             permission_classes=[permissions.IsAuthenticated]
             )
     def subscriptions(self, request):
         user = request.user
-        subscriptions = User.objects.filter(subscribers__user=user)
+        subscriptions = self.get_subscription_queryset(
+            User.objects.filter(subscribers__user=user)
+        )
 
         page = self.paginate_queryset(subscriptions)
         if page is not None:
@@ -76,15 +112,32 @@ class UserViewSet(DjoserUserViewSet):
                     {"errors": "Вы уже подписаны на этого пользователя"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            Subscription.objects.create(user=user, author=author)
+            with transaction.atomic():
+                Subscription.objects.create(user=user, author=author)
+                User.objects.filter(pk=author.pk).update(
+                    subscribers_count=F('subscribers_count') + 1
+                )
+                transaction.on_commit(
+                    partial(backfill_feed.delay, user.pk, author.pk)
+                )
             serializer = SubscriptionSerializer(
-                author, context={"request": request})
+                self.get_subscription_queryset(
+                    User.objects.filter(pk=author.pk)
+                ).get(),
+                context={"request": request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            subscription = user.subscriptions.filter(author=author).first()
-            if subscription:
-                subscription.delete()
+            with transaction.atomic():
+                deleted, _ = user.subscriptions.filter(author=author).delete()
+                if deleted:
+                    User.objects.filter(pk=author.pk).update(
+                        subscribers_count=F('subscribers_count') - 1
+                    )
+                    transaction.on_commit(
+                        partial(trim_feed.delay, user.pk, author.pk)
+                    )
+            if deleted:
                 return Response(status=status.HTTP_204_NO_CONTENT)
             return Response(
                 {"errors": "Вы не подписаны на этого пользователя"},
@@ -125,12 +178,15 @@ class UserViewSet(DjoserUserViewSet):
 
         if request.method == 'DELETE':
             if request.user.avatar:
-                request.user.avatar.delete()
+                request.user.avatar.delete(save=False)
+                request.user.avatar_variants = {}
                 request.user.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(AnonymousResponseCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
+    cache_resources = ('ingredients',)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
@@ -138,16 +194,33 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
-
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        limit = request.query_params.get('limit')
+        contains = request.query_params.get('contains')
+        return Response(ingredient_index.search(
+            name,
+            limit=int(limit) if limit and limit.isdigit() else None,
+            contains=contains not in ('0', 'false'),
+        ))
+
+
+class RecipeViewSet(AnonymousResponseCacheMixin, viewsets.ModelViewSet):
+    cache_resources = ('recipes',)
     permission_classes = (
         permissions.IsAuthenticatedOrReadOnly,
         IsAuthorOrReadOnly,
     )
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
-    pagination_class = LimitPageNumberPagination
+    pagination_class = LimitOrCursorPagination
+
+    def get_queryset(self):
+        return Recipe.objects.with_related().with_user_flags(
+            self.request.user
+        )
 
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
@@ -162,7 +235,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         recipe = serializer.save()
         read_serializer = RecipeReadSerializer(
-            recipe, context=self.get_serializer_context())
+            self.get_queryset().get(pk=recipe.pk),
+            context=self.get_serializer_context())
         return Response(read_serializer.data, status=status.HTTP_201_CREATED)
 
     def update(self, request, *args, **kwargs):
@@ -175,10 +249,18 @@ class RecipeViewSet(viewsets.ModelViewSet):
         self.perform_update(serializer)
 
         read_serializer = RecipeReadSerializer(
-            instance, context=self.get_serializer_context()
+            self.get_queryset().get(pk=instance.pk),
+            context=self.get_serializer_context()
         )
         return Response(read_serializer.data)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') - 1
+        )
+        instance.delete()
+
     @action(
         detail=True,
         methods=['get'],
@@ -204,22 +286,30 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            request.user.favorites.create(recipe=recipe)
+            with transaction.atomic():
+                request.user.favorites.create(recipe=recipe)
+                Recipe.objects.filter(pk=recipe.pk).update(
+                    favorites_count=F('favorites_count') + 1
+                )
             serializer = RecipeShortSerializer(
                 recipe, context=self.get_serializer_context())
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            in_favorite = request.user.favorites.filter(recipe=recipe).exists()
-
-            if not in_favorite:
-                return Response(
-                    {"errors": "Рецепт не находится в избранном"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            request.user.favorites.filter(recipe=recipe).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            with transaction.atomic():
+                deleted, _ = request.user.favorites.filter(
+                    recipe=recipe
+                ).delete()
+                if deleted:
+                    Recipe.objects.filter(pk=recipe.pk).update(
+                        favorites_count=F('favorites_count') - 1
+                    )
+            if deleted:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            return Response(
+                {"errors": "Рецепт не находится в избранном"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
     @action(
         detail=True,
@@ -238,21 +328,52 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            request.user.shopping_cart.create(recipe=recipe)
+            with transaction.atomic():
+                request.user.shopping_cart.create(recipe=recipe)
+                Recipe.objects.filter(pk=recipe.pk).update(
+                    carts_count=F('carts_count') + 1
+                )
             serializer = RecipeShortSerializer(
                 recipe, context=self.get_serializer_context()
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         if request.method == 'DELETE':
-            if not exists:
-                return Response(
-                    {"errors": "Рецепт не находится в списке покупок"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+            with transaction.atomic():
+                deleted, _ = request.user.shopping_cart.filter(
+                    recipe=recipe
+                ).delete()
+                if deleted:
+                    Recipe.objects.filter(pk=recipe.pk).update(
+                        carts_count=F('carts_count') - 1
+                    )
+            if deleted:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            return Response(
+                {"errors": "Рецепт не находится в списке покупок"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-            request.user.shopping_cart.filter(recipe=recipe).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def feed(self, request):
+        before = request.query_params.get('before')
+        before = int(before) if before and before.isdigit() else None
+        limit = self.paginator.get_page_size(request)
+        recipe_ids = get_feed_ids(request.user.pk, before=before, limit=limit)
+        recipes = self.get_queryset().filter(id__in=recipe_ids)
+        serializer = RecipeReadSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        next_url = None
+        if len(recipe_ids) == limit:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), 'before', recipe_ids[-1]
+            )
+        return Response({'next': next_url, 'results': serializer.data})
 
     @action(
         detail=False,
@@ -260,28 +381,19 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=[permissions.IsAuthenticated],
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        recipes = user.shopping_cart.values_list('recipe', flat=True)
-
-        ingredients = IngredientRecipe.objects.filter(
-            recipe__in=recipes
-        ).select_related('ingredient')
-
-        shopping_list = defaultdict(lambda: {'unit': '', 'amount': 0})
-        for item in ingredients:
-            name = item.ingredient.name
-            unit = item.ingredient.measurement_unit
-            shopping_list[name]['unit'] = unit
-            shopping_list[name]['amount'] += item.amount
-
-        lines = ["Список покупок:\n"]
-        for name, data in shopping_list.items():
-            lines.append(f"{name} ({data['unit']}) — {data['amount']}")
-
-        content = "\n".join(lines)
-        response = HttpResponse(content, content_type='text/plain')
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_CART_FORMATS:
+            return Response(
+                {"errors": "Неподдерживаемый формат файла"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        content_type, render = SHOPPING_CART_FORMATS[file_format]
+        items = get_shopping_list(request.user).iterator()
+        response = StreamingHttpResponse(
+            render(items), content_type=content_type
+        )
         response['Content-Disposition'] = (
-            'attachment; filename="shopping_cart.txt"'
+            f'attachment; filename="shopping_cart.{file_format}"'
         )
         return response
 
@@ -304,9 +416,65 @@ def run_book_task(request):
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_task_status(request, task_id):
-    result = AsyncResult(task_id)
+    # Each ?wait= request holds a sync worker, so anonymous clients get
+    # the current status and the wait is capped at SYNC_MAX_WAIT; the
+    # async view (ASYNC_READ_VIEWS) waits up to MAX_WAIT for everyone.
+    wait = parse_wait(request.query_params)
+    if wait and request.user.is_authenticated:
+        return Response(wait_for_task_payload(task_id, wait))
+    return Response(get_task_payload(task_id))
+
+
+async def task_status_events(request, task_id):
+    # Over WSGI Django collects the whole stream before sending it, so
+    # only the current status is sent there; nginx routes this path to
+    # the ASGI server.
+    timeout = EVENTS_TIMEOUT if isinstance(request, ASGIRequest) else 0
+    response = StreamingHttpResponse(
+        stream_task_events(task_id, timeout),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search_docs_view(request):
+    text = request.query_params.get('q', '')
+    source = request.query_params.get('source') or None
+    if source is not None and source not in DOC_SOURCES:
+        return Response(
+            {"source": [f"Допустимые значения: {', '.join(DOC_SOURCES)}"]},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    paginator = LimitOrCursorPagination()
+    limit = paginator.get_page_size(request)
+    try:
+        page = max(int(request.query_params.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+
+    try:
+        data = search_docs(text, source, (page - 1) * limit, limit)
+    except RedisError:
+        return Response(
+            {"errors": "Поиск временно недоступен"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+
+    url = request.build_absolute_uri()
+    next_url = previous_url = None
+    if page * limit < data['count']:
+        next_url = replace_query_param(url, 'page', page + 1)
+    if page > 2:
+        previous_url = replace_query_param(url, 'page', page - 1)
+    elif page == 2:
+        previous_url = remove_query_param(url, 'page')
     return Response({
-        'task_id': task_id,
-        'status': result.status,
-        'result': result.result if result.ready() else None,
+        'count': data['count'],
+        'next': next_url,
+        'previous': previous_url,
+        'results': data['results'],
     })
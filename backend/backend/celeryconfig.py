@@ -1,11 +1,40 @@
 import os
 
+from kombu import Queue
+
 broker_url = os.getenv('CELERY_BROKER_URL')
-result_backend = 'rpc://'
+result_backend = os.getenv(
+    'CELERY_RESULT_BACKEND',
+    'redis://{}:{}/1'.format(
+        os.getenv('APP_REDIS_HOST', 'localhost'),
+        os.getenv('APP_REDIS_PORT', '6379')
+    )
+)
+result_expires = 3600
 task_serializer = 'json'
 result_serializer = 'json'
 accept_content = ['json']
 timezone = 'Europe/Moscow'
 enable_utc = True
 task_acks_late = True
-worker_concurrency = 2
\ No newline at end of file
+worker_concurrency = 2
+# With acks_late a prefetched message is held unacknowledged until it
+# runs, so long tasks must not pile up behind each other.
+worker_prefetch_multiplier = int(
+    os.getenv('CELERY_WORKER_PREFETCH_MULTIPLIER', 1)
+)
+
+task_queues = (
+    Queue('io'),
+    Queue('cpu'),
+    Queue('maintenance'),
+)
+task_default_queue = 'maintenance'
+task_routes = {
+    'api.tasks.get_book': {'queue': 'io'},
+    'api.tasks.get_bible_verse': {'queue': 'io'},
+    'api.tasks.process_image': {'queue': 'cpu'},
+    'api.tasks.fan_out_recipe': {'queue': 'maintenance'},
+    'api.tasks.backfill_feed': {'queue': 'maintenance'},
+    'api.tasks.trim_feed': {'queue': 'maintenance'},
+}
\ No newline at end of file
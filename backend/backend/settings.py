@@ -26,6 +26,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'corsheaders',
     'rest_framework.authtoken',
@@ -38,6 +39,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'services.metrics.MetricsMiddleware',
+    'services.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -48,6 +51,20 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Requests slower than this (seconds) are logged with their top queries.
+SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', 1.0))
+# One SQL template executed this many times in a request is logged as N+1.
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))
+
+# Requests carrying this token (X-Profile header or ?profile=) are
+# profiled; see services.profiling. Profiling is off while it is empty.
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILING_INTERVAL = float(os.getenv('PROFILING_INTERVAL', 0.005))
+
+# Serve the hottest GETs from api.async_views; meant for ASGI workers
+# (SERVER_MODE=asgi in gunicorn.conf.py).
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', '').lower() in ('1', 'true')
+
 CORS_URLS_REGEX = r'^/api/.*$'
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000',
@@ -137,6 +154,18 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = '/app/media'
+MAX_IMAGE_UPLOAD_SIZE = 5 * 1024 * 1024
+# Base64 inflates uploads by 4/3, leave room for the rest of the payload.
+DATA_UPLOAD_MAX_MEMORY_SIZE = 7 * 1024 * 1024
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'services.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -3,9 +3,17 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from services.metrics import metrics_view
+from services import profiling
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    path('profiling/', profiling.profile_list, name='profiling'),
+    path('profiling/sampler/', profiling.start_sampler),
+    path('profiling/tasks/', profiling.arm_task_profile),
+    path('profiling/<str:profile_id>/', profiling.profile_download),
 ]
 
 if settings.DEBUG:
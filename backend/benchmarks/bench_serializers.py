@@ -0,0 +1,120 @@
+import pytest
+
+from api.filters import IngredientFilter
+from api.serializers import (
+    RecipeReadSerializer, RecipeWriteSerializer, SubscriptionSerializer
+)
+from api.shopping_cart import get_shopping_list, render_txt
+from api.views import UserViewSet
+from recipes.models import Ingredient, Recipe
+from users.models import User
+
+pytestmark = pytest.mark.django_db
+
+PIXEL_PNG = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg=='
+)
+INGREDIENTS_PER_RECIPE = 3
+# One PK lookup per ingredient during validation, plus the savepoint
+# pair, the insert/update, the counter, bulk_create and search vector.
+WRITE_QUERY_BUDGET = INGREDIENTS_PER_RECIPE + 6
+
+
+@pytest.mark.parametrize('page_size', [6, 50, 100])
+def test_recipe_read_serializer(measure, make_request, reader, page_size):
+    def serialize():
+        recipes = Recipe.objects.with_related().with_user_flags(
+            reader
+        )[:page_size]
+        return RecipeReadSerializer(
+            recipes, many=True, context={'request': make_request(reader)}
+        ).data
+
+    # Recipes with flags and authors, then one prefetch of ingredients.
+    data = measure(serialize, max_queries=2)
+    assert len(data) == page_size
+
+
+@pytest.mark.parametrize('recipes_limit', [1, 3, 10, None])
+def test_subscription_serializer(measure, make_request, follower,
+                                 recipes_limit):
+    query = {} if recipes_limit is None else {'recipes_limit': recipes_limit}
+
+    def serialize():
+        request = make_request(follower, **query)
+        view = UserViewSet(request=request, format_kwarg=None)
+        authors = view.get_subscription_queryset(
+            User.objects.filter(subscribers__user=follower)
+        )[:6]
+        return SubscriptionSerializer(
+            authors, many=True, context={'request': request}
+        ).data
+
+    # Authors with the subscribed flag, then one prefetch of recipes.
+    data = measure(serialize, max_queries=2)
+    if recipes_limit is not None:
+        assert all(len(item['recipes']) <= recipes_limit for item in data)
+
+
+def test_shopping_cart_aggregation(measure, reader):
+    def render():
+        return ''.join(render_txt(get_shopping_list(reader).iterator()))
+
+    measure(render, max_queries=1)
+
+
+def recipe_payload():
+    ingredient_ids = Ingredient.objects.order_by('?').values_list(
+        'pk', flat=True
+    )[:INGREDIENTS_PER_RECIPE]
+    return {
+        'name': 'Бенчмарк',
+        'text': 'Рецепт из бенчмарка',
+        'cooking_time': 30,
+        'image': PIXEL_PNG,
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 100}
+            for ingredient_id in ingredient_ids
+        ],
+    }
+
+
+def test_recipe_write_serializer_create(measure, make_request, author):
+    payload = recipe_payload()
+
+    def create():
+        serializer = RecipeWriteSerializer(
+            data=payload, context={'request': make_request(author)}
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    recipe = measure(create, max_queries=WRITE_QUERY_BUDGET)
+    assert recipe.recipe_ingredients.count() == INGREDIENTS_PER_RECIPE
+
+
+def test_recipe_write_serializer_update(measure, make_request, author):
+    recipe = Recipe.objects.filter(author=author).first()
+    payload = recipe_payload()
+    del payload['image']
+
+    def update():
+        serializer = RecipeWriteSerializer(
+            recipe, data=payload, partial=True,
+            context={'request': make_request(author)}
+        )
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    measure(update, max_queries=WRITE_QUERY_BUDGET)
+
+
+@pytest.mark.parametrize('name', ['л', 'bench ингредиент 1', 'нет такого'])
+def test_ingredient_filter(measure, name):
+    def lookup():
+        return list(IngredientFilter(
+            {'name': name}, queryset=Ingredient.objects.all()
+        ).qs)
+
+    measure(lookup, max_queries=1)
@@ -0,0 +1,61 @@
+import pytest
+
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+def get(api_client, user, url):
+    api_client.force_authenticate(user)
+    response = api_client.get(url)
+    assert response.status_code == 200, response.content
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+@pytest.mark.parametrize('limit', [6, 50, 100])
+def test_recipe_list(measure, api_client, reader, limit):
+    # Count, page with user flags, ingredient prefetch.
+    measure(
+        lambda: get(api_client, reader, f'/api/recipes/?limit={limit}'),
+        max_queries=3,
+    )
+
+
+def test_recipe_list_favorited(measure, api_client, reader):
+    measure(
+        lambda: get(api_client, reader, '/api/recipes/?is_favorited=1'),
+        max_queries=3,
+    )
+
+
+def test_recipe_detail(measure, api_client, reader):
+    recipe_id = Recipe.objects.values_list('pk', flat=True).first()
+    measure(
+        lambda: get(api_client, reader, f'/api/recipes/{recipe_id}/'),
+        max_queries=2,
+    )
+
+
+@pytest.mark.parametrize('recipes_limit', [1, 3, 10])
+def test_subscriptions(measure, api_client, follower, recipes_limit):
+    # Count, page of authors, recipe prefetch.
+    measure(
+        lambda: get(
+            api_client, follower,
+            f'/api/users/subscriptions/?recipes_limit={recipes_limit}'
+        ),
+        max_queries=3,
+    )
+
+
+@pytest.mark.parametrize('file_format', ['txt', 'csv'])
+def test_download_shopping_cart(measure, api_client, reader, file_format):
+    measure(
+        lambda: get(
+            api_client, reader,
+            f'/api/recipes/download_shopping_cart/?file_format={file_format}'
+        ),
+        max_queries=1,
+    )
@@ -0,0 +1,116 @@
+"""Fixtures for the serializer and view benchmarks.
+
+Run from ``backend/`` against a local Postgres (the schema relies on
+tsvector, GIN and pg_trgm indexes, so SQLite cannot host it)::
+
+    pip install -r benchmarks/requirements.txt
+    pytest benchmarks
+    pytest benchmarks --benchmark-compare
+
+Every run is saved as JSON under ``.benchmarks/``, together with the
+query count of each case in ``extra_info``; ``--benchmark-compare``
+diffs against the previous run, ``--benchmark-compare=0003`` against a
+specific one.
+"""
+import io
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from users.models import User
+
+DATASET = {
+    'users': 200,
+    'recipes': 3000,
+    'ingredients': 500,
+    'subscriptions_per_user': 10,
+    'favorites_per_user': 20,
+    'carts_per_user': 10,
+}
+PREFIX = 'bench'
+
+
+def pytest_collection_modifyitems(config, items):
+    # pytest-django blocks ensure_connection() outside tests, so probe
+    # with a raw driver connection instead.
+    try:
+        connection.get_new_connection(
+            connection.get_connection_params()
+        ).close()
+    except connection.Database.OperationalError as error:
+        skip = pytest.mark.skip(reason=f'Postgres is not available: {error}')
+        for item in items:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope='session')
+def media_root(tmp_path_factory):
+    media = override_settings(MEDIA_ROOT=tmp_path_factory.mktemp('media'))
+    media.enable()
+    yield
+    media.disable()
+
+
+@pytest.fixture(scope='session')
+def django_db_setup(django_db_setup, django_db_blocker, media_root):
+    with django_db_blocker.unblock():
+        call_command(
+            'seed_dataset', prefix=PREFIX, stdout=io.StringIO(), **DATASET
+        )
+
+
+@pytest.fixture
+def reader(db):
+    return User.objects.get(username=f'{PREFIX}1')
+
+
+@pytest.fixture
+def follower(db):
+    return User.objects.filter(
+        username__startswith=PREFIX
+    ).annotate(
+        total=Count('subscriptions')
+    ).order_by('-total').first()
+
+
+@pytest.fixture
+def author(db):
+    return User.objects.filter(
+        username__startswith=PREFIX
+    ).order_by('-recipes_count').first()
+
+
+@pytest.fixture
+def make_request():
+    factory = APIRequestFactory()
+
+    def make(user, path='/', **query):
+        request = Request(factory.get(path, query))
+        request.user = user
+        return request
+    return make
+
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def measure(benchmark):
+    """Checks the query budget of one call, then benchmarks the call."""
+    def run(func, max_queries):
+        with CaptureQueriesContext(connection) as queries:
+            result = func()
+        benchmark.extra_info['queries'] = len(queries)
+        assert len(queries) <= max_queries, '\n'.join(
+            query['sql'] for query in queries.captured_queries
+        )
+        benchmark(func)
+        return result
+    return run
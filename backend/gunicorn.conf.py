@@ -0,0 +1,35 @@
+"""Loaded by gunicorn from the working directory (/app).
+
+Workers (``WEB_CONCURRENCY``) share one Prometheus multiprocess
+directory, see ``services.metrics``. Only gunicorn sets it, so Celery
+workers and daphne keep the in-process registry.
+
+``SERVER_MODE=asgi`` runs uvicorn workers on ``backend.asgi`` and turns
+on the async read views (``ASYNC_READ_VIEWS``); the default is the sync
+WSGI stack.
+"""
+import os
+import shutil
+
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+
+if os.getenv('SERVER_MODE', 'wsgi') == 'asgi':
+    os.environ.setdefault('ASYNC_READ_VIEWS', '1')
+    # uvicorn-worker needs gunicorn 21+, the image pins 20.1.
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    wsgi_app = 'backend.asgi:application'
+else:
+    wsgi_app = 'backend.wsgi:application'
+
+
+def on_starting(server):
+    # Samples left by the previous run would be summed into the new ones.
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
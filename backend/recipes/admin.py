@@ -32,7 +32,7 @@ class RecipeAdmin(admin.ModelAdmin):
     readonly_fields = ('get_favorite_count',)
 
     def get_favorite_count(self, obj):
-        return obj.favorited_by.count()
+        return obj.favorites_count
 
     get_favorite_count.short_description = 'Добавлений в избранное'
 
@@ -0,0 +1,41 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Subscription
+
+from .models import Favorite, Recipe, ShoppingCart
+
+User = get_user_model()
+
+
+def count_of(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            total=Count('pk')
+        ).values('total')
+    ), 0)
+
+
+def get_counters():
+    return (
+        (Recipe, 'favorites_count', count_of(Favorite, 'recipe')),
+        (Recipe, 'carts_count', count_of(ShoppingCart, 'recipe')),
+        (User, 'recipes_count', count_of(Recipe, 'author')),
+        (User, 'subscribers_count', count_of(Subscription, 'author')),
+    )
+
+
+def reconcile_counters():
+    fixed = {}
+    with transaction.atomic():
+        for model, field, actual in get_counters():
+            fixed[f'{model._meta.model_name}.{field}'] = (
+                model.objects.exclude(**{field: actual}).update(
+                    **{field: actual}
+                )
+            )
+    return fixed
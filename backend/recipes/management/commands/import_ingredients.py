@@ -0,0 +1,194 @@
+import csv
+import io
+import json
+import re
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.cache import bump_cache_version
+from recipes.models import Ingredient
+
+STAGING_TABLE = 'ingredient_import'
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if len(row) >= 2:
+                yield row[0], row[1]
+
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    """Yields the items of a top-level JSON array one at a time.
+
+    Only the current chunk and the item being decoded are held in memory,
+    unlike ``json.load``, which builds the whole list first.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+
+    def read_more():
+        nonlocal buffer, position, eof
+        chunk = file.read(chunk_size)
+        buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+        return not eof
+
+    state = 'start'
+    while True:
+        position = WHITESPACE.match(buffer, position).end()
+        if position == len(buffer):
+            if not read_more():
+                raise ValueError('JSON ended before the array was closed')
+            continue
+        char = buffer[position]
+        if state == 'start':
+            if char != '[':
+                raise ValueError('Expected a JSON array')
+            position += 1
+            state = 'first'
+        elif char == ']' and state in ('first', 'after'):
+            return
+        elif char == ',' and state == 'after':
+            position += 1
+            state = 'item'
+        elif state in ('first', 'item'):
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not read_more():
+                    raise
+                continue
+            # A number cut by the chunk boundary still decodes ("2." as
+            # 2), so trust the value only once a delimiter follows it.
+            if not eof and (
+                end == len(buffer) or buffer[end] not in ' \t\n\r,]'
+            ):
+                read_more()
+                continue
+            yield item
+            position = end
+            state = 'after'
+        else:
+            raise ValueError(f'Unexpected {char!r} in JSON array')
+
+
+def read_json(path):
+    with open(path, encoding='utf-8') as file:
+        for item in iter_json_array(file):
+            fields = item.get('fields', item)
+            yield fields['name'], fields['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+class CopyStream(io.RawIOBase):
+    def __init__(self, rows, on_progress, progress_every):
+        self._rows = rows
+        self._buffer = b''
+        self._on_progress = on_progress
+        self._progress_every = progress_every
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def _next_line(self):
+        for name, measurement_unit in self._rows:
+            name, measurement_unit = name.strip(), measurement_unit.strip()
+            if not name or not measurement_unit:
+                continue
+            self.count += 1
+            if self.count % self._progress_every == 0:
+                self._on_progress(self.count)
+            line = io.StringIO()
+            csv.writer(line).writerow([name, measurement_unit])
+            return line.getvalue().encode()
+        return b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            line = self._next_line()
+            if not line:
+                break
+            self._buffer += line
+        if size < 0:
+            size = len(self._buffer)
+        chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON через COPY с upsert'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='data/ingredients.csv',
+            help='Путь к файлу .csv (название,единица) или .json',
+        )
+        parser.add_argument(
+            '--progress-every',
+            type=int,
+            default=10000,
+            help='Как часто выводить прогресс (в строках)',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+
+        started = time.monotonic()
+
+        def report(count):
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'Прочитано строк: {count} '
+                f'({count / elapsed if elapsed else 0:.0f} строк/с)'
+            )
+
+        stream = CopyStream(reader(path), report, options['progress_every'])
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMP TABLE {STAGING_TABLE} ('
+                'position bigserial, '
+                'name varchar(256), measurement_unit varchar(100)'
+                ') ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                f'COPY {STAGING_TABLE} (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                stream,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ('
+                'SELECT name, measurement_unit, min(position) AS position '
+                f'FROM {STAGING_TABLE} GROUP BY name, measurement_unit'
+                ') AS staged ORDER BY position '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            inserted = cursor.rowcount
+        bump_cache_version('ingredients', 'recipes')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {stream.count}, добавлено: {inserted}, '
+            f'пропущено: {stream.count - inserted}, '
+            f'{elapsed:.2f} с ({stream.count / elapsed if elapsed else 0:.0f} '
+            'строк/с)'
+        ))
@@ -0,0 +1,229 @@
+import io
+import json
+import random
+import time
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from api.cache import bump_cache_version
+from recipes.counters import reconcile_counters
+from recipes.models import (
+    Favorite, Ingredient, IngredientRecipe, Recipe, ShoppingCart
+)
+from users.models import Subscription, User
+
+BATCH_SIZE = 5000
+MEASUREMENT_UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.')
+WORDS = (
+    'суп', 'салат', 'пирог', 'каша', 'рагу', 'запеканка', 'паста',
+    'котлеты', 'плов', 'блины', 'омлет', 'борщ', 'десерт', 'соус',
+)
+
+
+def zipf_cum_weights(size, exponent):
+    """Cumulative Zipf weights: rank k is picked with weight 1 / k ** s."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (230, 160, 60)).save(buffer, 'PNG')
+    return default_storage.save(
+        'recipes/images/seed.png', ContentFile(buffer.getvalue())
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует пользователей, рецепты, подписки, избранное и '
+        'списки покупок с Zipf-распределением популярности'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument(
+            '--subscriptions-per-user', type=int, default=10
+        )
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument(
+            '--zipf-exponent',
+            type=float,
+            default=1.1,
+            help='Показатель s: вес k-го по популярности объекта 1 / k^s',
+        )
+        parser.add_argument('--prefix', default='loadtest')
+        parser.add_argument(
+            '--password',
+            default='loadtest-password',
+            help='Общий пароль всех созданных пользователей',
+        )
+        parser.add_argument(
+            '--tokens-file',
+            help='Создать токены и сохранить их в JSON для locust',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def log(self, message):
+        self.stdout.write(
+            f'[{time.monotonic() - self.started:7.1f} с] {message}'
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['recipes'] < 1:
+            raise CommandError('Нужно минимум 2 пользователя и 1 рецепт')
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже существуют'
+            )
+
+        self.started = time.monotonic()
+        self.rng = random.Random(options['seed'])
+        self.exponent = options['zipf_exponent']
+
+        with transaction.atomic():
+            users = self.create_users(
+                prefix, options['users'], options['password']
+            )
+            ingredient_ids = self.create_ingredients(
+                prefix, options['ingredients']
+            )
+            recipes = self.create_recipes(
+                users, ingredient_ids, options['recipes']
+            )
+            self.create_relations(
+                Subscription, 'author', users, users,
+                options['subscriptions_per_user'],
+            )
+            self.create_relations(
+                Favorite, 'recipe', users, recipes,
+                options['favorites_per_user'],
+            )
+            self.create_relations(
+                ShoppingCart, 'recipe', users, recipes,
+                options['carts_per_user'],
+            )
+            reconcile_counters()
+            Recipe.objects.filter(
+                author__username__startswith=prefix
+            ).update_search_vector()
+            self.log('Счётчики и поисковые векторы обновлены')
+        bump_cache_version('ingredients', 'recipes')
+
+        if options['tokens_file']:
+            self.write_tokens(users, options['tokens_file'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: {len(users)} пользователей, {len(recipes)} рецептов'
+        ))
+
+    def pick(self, population, count):
+        return self.rng.choices(
+            population,
+            cum_weights=zipf_cum_weights(len(population), self.exponent),
+            k=count,
+        )
+
+    def create_users(self, prefix, count, password):
+        password_hash = make_password(password)
+        users = User.objects.bulk_create([
+            User(
+                email=f'{prefix}{number}@example.com',
+                username=f'{prefix}{number}',
+                first_name='Нагрузка',
+                last_name=f'Тест {number}',
+                password=password_hash,
+            )
+            for number in range(count)
+        ], batch_size=BATCH_SIZE)
+        self.log(f'Пользователей: {len(users)}')
+        return users
+
+    def create_ingredients(self, prefix, count):
+        Ingredient.objects.bulk_create([
+            Ingredient(
+                name=f'{prefix} ингредиент {number}',
+                measurement_unit=self.rng.choice(MEASUREMENT_UNITS),
+            )
+            for number in range(count)
+        ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+        ingredient_ids = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        if not ingredient_ids:
+            raise CommandError('Нет ингредиентов: укажите --ingredients')
+        self.rng.shuffle(ingredient_ids)
+        self.log(f'Ингредиентов в базе: {len(ingredient_ids)}')
+        return ingredient_ids
+
+    def create_recipes(self, users, ingredient_ids, count):
+        image = make_image()
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                author=author,
+                name=f'{self.rng.choice(WORDS)} {number}',
+                text=' '.join(self.rng.choices(WORDS, k=12)),
+                image=image,
+                cooking_time=self.rng.randint(5, 180),
+            )
+            for number, author in enumerate(self.pick(users, count))
+        ], batch_size=BATCH_SIZE)
+
+        cum_weights = zipf_cum_weights(len(ingredient_ids), self.exponent)
+        rows = []
+        for recipe in recipes:
+            picked = set(self.rng.choices(
+                ingredient_ids, cum_weights=cum_weights,
+                k=self.rng.randint(3, 8),
+            ))
+            rows.extend(
+                IngredientRecipe(
+                    recipe=recipe,
+                    ingredient_id=ingredient_id,
+                    amount=self.rng.randint(1, 500),
+                )
+                for ingredient_id in picked
+            )
+        IngredientRecipe.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+        self.log(
+            f'Рецептов: {len(recipes)}, ингредиентов в них: {len(rows)}'
+        )
+        return recipes
+
+    def create_relations(self, model, target_field, users, targets, per_user):
+        cum_weights = zipf_cum_weights(len(targets), self.exponent)
+        rows = []
+        for user in users:
+            picked = set(self.rng.choices(
+                targets, cum_weights=cum_weights,
+                k=self.rng.randint(0, 2 * per_user),
+            ))
+            picked.discard(user)
+            rows.extend(
+                model(user=user, **{target_field: target})
+                for target in picked
+            )
+        model.objects.bulk_create(
+            rows, batch_size=BATCH_SIZE, ignore_conflicts=True
+        )
+        self.log(f'{model._meta.verbose_name_plural}: {len(rows)}')
+
+    def write_tokens(self, users, path):
+        tokens = Token.objects.bulk_create(
+            [Token(user=user, key=Token.generate_key()) for user in users],
+            batch_size=BATCH_SIZE,
+        )
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump([token.key for token in tokens], file)
+        self.log(f'Токены сохранены в {path}')
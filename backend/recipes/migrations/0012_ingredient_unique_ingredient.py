@@ -0,0 +1,65 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:47
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+# recipes.models.MAX_AMOUNT_VALUE when this migration was written.
+MAX_AMOUNT = 32000
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).order_by().annotate(
+        keep_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for group in duplicates:
+        extra_ids = Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(id=group['keep_id']).values_list('id', flat=True)
+        IngredientRecipe.objects.filter(ingredient_id__in=extra_ids).update(
+            ingredient_id=group['keep_id']
+        )
+        Ingredient.objects.filter(id__in=list(extra_ids)).delete()
+        merge_recipe_rows(IngredientRecipe, group['keep_id'])
+    if schema_editor.connection.vendor == 'postgresql':
+        # Run the deferred foreign key checks of the deletes now, as
+        # Postgres refuses to alter a table with pending trigger events.
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+
+def merge_recipe_rows(IngredientRecipe, ingredient_id):
+    # A recipe that used several of the duplicates now lists the kept
+    # ingredient more than once; keep one row with the summed amount.
+    repeated = IngredientRecipe.objects.filter(
+        ingredient_id=ingredient_id
+    ).values('recipe_id').order_by().annotate(
+        keep_id=Min('id'), total_amount=Sum('amount'),
+        total=Count('id')
+    ).filter(total__gt=1)
+    for row in repeated:
+        IngredientRecipe.objects.filter(id=row['keep_id']).update(
+            amount=min(row['total_amount'], MAX_AMOUNT)
+        )
+        IngredientRecipe.objects.filter(
+            recipe_id=row['recipe_id'], ingredient_id=ingredient_id
+        ).exclude(id=row['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -1,13 +1,20 @@
 from django.db import models
+from django.db.models.functions import Cast, Coalesce, Upper
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib.auth import get_user_model
 
+from users.models import Subscription
+
 User = get_user_model()
 
 MIN_COOKING_VALUE = 1
 MAX_COOKING_VALUE = 32000
 MIN_AMOUNT_VALUE = 1
 MAX_AMOUNT_VALUE = 32000
+SEARCH_CONFIG = 'russian'
 
 
 class Ingredient(models.Model):
@@ -24,11 +31,83 @@ class Ingredient(models.Model):
         verbose_name = "Ингредиент"
         verbose_name_plural = "Ингредиенты"
         ordering = ["name"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
+        indexes = [
+            models.Index(
+                OpClass(
+                    Upper(Cast('name', output_field=models.TextField())),
+                    name='text_pattern_ops',
+                ),
+                name='ingredient_name_upper_pattern',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        return self.defer('search_vector').select_related(
+            'author'
+        ).prefetch_related(
+            models.Prefetch(
+                'recipe_ingredients',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            )
+        )
+
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            false = models.Value(False, output_field=models.BooleanField())
+            return self.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false,
+                author_subscribed=false,
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+            author_subscribed=models.Exists(
+                Subscription.objects.filter(
+                    user=user, author=models.OuterRef('author')
+                )
+            ),
+        )
+
+    def update_search_vector(self):
+        ingredient_names = IngredientRecipe.objects.filter(
+            recipe=models.OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(
+                Coalesce(
+                    models.Subquery(ingredient_names), models.Value(''),
+                    output_field=models.TextField(),
+                ),
+                weight='B',
+                config=SEARCH_CONFIG,
+            )
+            + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+        ))
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -45,6 +124,12 @@ class Recipe(models.Model):
         blank=True,
         verbose_name='Картинка',
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Варианты картинки',
+    )
     text = models.TextField(
         max_length=256,
         verbose_name='Описание',
@@ -66,11 +151,43 @@ class Recipe(models.Model):
         ],
         verbose_name='Время приготовления',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное',
+    )
+    carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в список покупок',
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор',
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['author', '-id'], name='recipe_author_id_desc'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_popularity',
+            ),
+            GinIndex(fields=['search_vector'], name='recipe_search_vector'),
+            GinIndex(
+                fields=['name'],
+                name='recipe_name_trgm',
+                opclasses=['gin_trgm_ops'],
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -104,6 +221,13 @@ class IngredientRecipe(models.Model):
     class Meta:
         verbose_name = 'Ингредиент в рецепте'
         verbose_name_plural = 'Ингредиенты в рецепте'
+        indexes = [
+            models.Index(
+                fields=['recipe', 'ingredient'],
+                include=['amount'],
+                name='ingredientrecipe_recipe_cover',
+            ),
+        ]
 
 
 class Favorite(models.Model):
@@ -129,6 +253,11 @@ class Favorite(models.Model):
                 name='unique_favorite'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='favorite_recipe_user'
+            ),
+        ]
 
 
 class ShoppingCart(models.Model):
@@ -154,3 +283,8 @@ class ShoppingCart(models.Model):
                 name='unique_shopping_cart'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'], name='shoppingcart_recipe_user'
+            ),
+        ]
@@ -9,5 +9,9 @@ class ServicesConfig(AppConfig):
     name = "services"
 
     def ready(self):
-        redis = Redis()
-        redis.create_index()
\ No newline at end of file
+        # The idx_docs index is created lazily by Redis.ensure_index()
+        # on the first write, so process start does not hit Redis.
+        from services.metrics import instrument_serializers
+
+        Redis()
+        instrument_serializers()
@@ -0,0 +1,287 @@
+"""Per-request performance metrics exported in the Prometheus format.
+
+``MetricsMiddleware`` measures every request and labels it with the
+resolved route name (``api:recipes-list``), never the raw path, so the
+series count stays bounded. SQL is observed through an
+execute wrapper installed on every new connection; serializer and Redis
+time are added by ``instrument_serializers`` and ``timed_redis``. The
+stats live in a context variable, so they follow a request into the
+threads ``sync_to_async`` runs its queries in.
+
+With ``PROMETHEUS_MULTIPROC_DIR`` set, every gunicorn worker writes its
+samples to that directory and ``metrics_view`` aggregates them, so a
+scrape sees the whole pod rather than one random worker. The directory
+is emptied on start and dead workers are marked by ``gunicorn.conf.py``.
+"""
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY,
+    generate_latest, multiprocess
+)
+
+logger = logging.getLogger(__name__)
+
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+TOP_QUERIES = 5
+# Collapses "IN (%s, %s, %s)" so lists of any length share one template.
+PLACEHOLDER_LIST = re.compile(r'%s(?:\s*,\s*%s)+')
+
+REQUEST_LATENCY = Histogram(
+    'foodgram_http_request_duration_seconds',
+    'Request latency by route',
+    ['view', 'method', 'status'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Histogram(
+    'foodgram_http_request_db_queries',
+    'SQL queries per request',
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+DB_TIME = Histogram(
+    'foodgram_http_request_db_seconds',
+    'Time spent in SQL per request',
+    ['view'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+SERIALIZER_TIME = Histogram(
+    'foodgram_http_request_serializer_seconds',
+    'Time spent building serializer data per request',
+    ['view'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5),
+)
+REDIS_TIME = Histogram(
+    'foodgram_http_request_redis_seconds',
+    'Time spent in Redis calls per request',
+    ['view'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5),
+)
+DUPLICATE_QUERIES = Counter(
+    'foodgram_http_duplicate_queries',
+    'Repeated executions of one SQL template within a request (N+1)',
+    ['view'],
+)
+SLOW_REQUESTS = Counter(
+    'foodgram_http_slow_requests',
+    'Requests slower than SLOW_REQUEST_THRESHOLD',
+    ['view'],
+)
+
+request_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.redis_time = 0.0
+        # SQL template -> [executions, total seconds]
+        self.queries = defaultdict(lambda: [0, 0.0])
+
+    @property
+    def query_count(self):
+        return sum(count for count, _ in self.queries.values())
+
+    def duplicates(self):
+        threshold = settings.N_PLUS_ONE_THRESHOLD
+        return {
+            sql: count for sql, (count, _) in self.queries.items()
+            if count >= threshold
+        }
+
+    def top_queries(self, limit=TOP_QUERIES):
+        return sorted(
+            self.queries.items(), key=lambda item: item[1][1], reverse=True
+        )[:limit]
+
+
+def record_query(execute, sql, params, many, context):
+    stats = request_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.db_time += elapsed
+        entry = stats.queries[PLACEHOLDER_LIST.sub('%s', sql)]
+        entry[0] += 1
+        entry[1] += elapsed
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed(attribute):
+    """Adds the wall time of the block to the current request's stats."""
+    stats = request_stats.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(
+            stats, attribute,
+            getattr(stats, attribute) + time.perf_counter() - started
+        )
+
+
+def timed_redis(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with timed('redis_time'):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def atimed_redis(func):
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        with timed('redis_time'):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def timed_serializer_data(prop):
+    @wraps(prop.fget)
+    def data(self):
+        stats = request_stats.get()
+        # Nested serializers (``RecipeShortSerializer(...).data`` inside
+        # a method field) run within the outer call, count them once.
+        if stats is None or stats.serializer_depth:
+            return prop.fget(self)
+        stats.serializer_depth += 1
+        try:
+            with timed('serializer_time'):
+                return prop.fget(self)
+        finally:
+            stats.serializer_depth -= 1
+    return property(data)
+
+
+def instrument_serializers():
+    from rest_framework import serializers
+
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        prop = cls.__dict__['data']
+        if not getattr(prop.fget, '__wrapped__', None):
+            cls.data = timed_serializer_data(prop)
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class MetricsMiddleware:
+    """Observes the request until the view returns its response.
+
+    Rows fetched lazily while a streaming response is sent (the shopping
+    list download, task status events) are not included.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        duration = time.perf_counter() - started
+        self.observe(request, response, stats, duration)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        duration = time.perf_counter() - started
+        self.observe(request, response, stats, duration)
+        return response
+
+    def observe(self, request, response, stats, duration):
+        view = get_view_name(request)
+        REQUEST_LATENCY.labels(
+            view, request.method, response.status_code
+        ).observe(duration)
+        DB_QUERIES.labels(view).observe(stats.query_count)
+        DB_TIME.labels(view).observe(stats.db_time)
+        SERIALIZER_TIME.labels(view).observe(stats.serializer_time)
+        REDIS_TIME.labels(view).observe(stats.redis_time)
+
+        duplicates = stats.duplicates()
+        if duplicates:
+            DUPLICATE_QUERIES.labels(view).inc(
+                sum(count - 1 for count in duplicates.values())
+            )
+            for sql, count in duplicates.items():
+                logger.warning(
+                    'N+1 in %s %s (%s): %d x %s',
+                    request.method, request.path, view, count, sql
+                )
+
+        if duration >= settings.SLOW_REQUEST_THRESHOLD:
+            SLOW_REQUESTS.labels(view).inc()
+            logger.warning(
+                'Slow request %s %s (%s): %.3fs, %d queries %.3fs, '
+                'serializers %.3fs, redis %.3fs\n%s',
+                request.method, request.path, view, duration,
+                stats.query_count, stats.db_time, stats.serializer_time,
+                stats.redis_time,
+                '\n'.join(
+                    f'  {total:.3f}s {count}x {sql}'
+                    for sql, (count, total) in stats.top_queries()
+                ),
+            )
+
+
+def metrics_view(request):
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST
+    )
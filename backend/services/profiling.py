@@ -0,0 +1,399 @@
+"""On-demand profiling of requests, workers and Celery tasks.
+
+Everything is disabled unless ``PROFILING_TOKEN`` is set; the token is
+passed in the ``X-Profile`` header or the ``profile`` query parameter.
+
+* A request carrying the token runs under ``ThreadSampler`` (or cProfile
+  with ``X-Profile-Mode: cprofile``) and gets ``X-Profile-Id`` back.
+* ``POST /profiling/sampler/?seconds=30`` starts ``SignalSampler`` in the
+  gunicorn worker that serves it: SIGPROF fires on CPU time only, so an
+  idle worker costs nothing.
+* ``POST /profiling/tasks/?task=api.tasks.process_image&count=5`` makes
+  the next runs of a task record a profile (see ``api.signals``).
+
+Samples are saved in the collapsed-stack format (``a;b;c 12``) read by
+flamegraph.pl and speedscope; cProfile runs are saved as pstats. Both
+are kept in Redis for ``PROFILE_TTL`` and listed by ``GET /profiling/``.
+"""
+import cProfile
+import logging
+import marshal
+import os
+import signal
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from hmac import compare_digest
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async
+)
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from redis.exceptions import RedisError
+
+from services.metrics import get_view_name
+from services.redis import Redis, dumps, loads
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TTL = 24 * 60 * 60
+PROFILE_LIMIT = 100
+MAX_SAMPLER_SECONDS = 300
+MAX_TASK_PROFILES = 20
+INDEX_KEY = 'profiling:index'
+
+
+def profile_key(profile_id):
+    return f'profiling:profile:{profile_id}'
+
+
+def task_profile_key(task_name):
+    return f'profiling:task:{task_name}'
+
+
+def collapse(frame):
+    names = []
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '?')
+        names.append(f'{module}:{frame.f_code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def render_collapsed(stacks):
+    return ''.join(
+        f'{stack} {count}\n' for stack, count in stacks.most_common()
+    ).encode()
+
+
+class ThreadSampler:
+    """Samples the stacks of some threads from a helper thread.
+
+    Follows the entering thread unless ``thread_ids`` are given. Works in
+    any thread, but not under the gevent pool, whose greenlets share one
+    OS thread.
+    """
+
+    format = 'collapsed'
+
+    def __init__(self, interval=None, thread_ids=None):
+        self.interval = interval or settings.PROFILING_INTERVAL
+        self.thread_ids = thread_ids
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def __enter__(self):
+        if self.thread_ids is None:
+            self.thread_ids = [threading.get_ident()]
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in self.thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[collapse(frame)] += 1
+
+    def dump(self):
+        return render_collapsed(self.stacks)
+
+
+class CProfileProfiler:
+    format = 'pstats'
+
+    def __enter__(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+
+    def dump(self):
+        self.profile.create_stats()
+        return marshal.dumps(self.profile.stats)
+
+
+PROFILERS = {
+    'sample': ThreadSampler,
+    'cprofile': CProfileProfiler,
+}
+
+
+class SignalSampler:
+    """Samples the main thread on SIGPROF for a fixed number of seconds.
+
+    Only one runs per process; ``start`` must be called from the main
+    thread, which is where gunicorn sync workers serve requests.
+    """
+
+    format = 'collapsed'
+    active = None
+    lock = threading.Lock()
+
+    def __init__(self, profile_id, seconds, interval=None):
+        self.profile_id = profile_id
+        self.seconds = seconds
+        self.interval = interval or settings.PROFILING_INTERVAL
+        self.stacks = Counter()
+
+    def start(self):
+        if threading.current_thread() is not threading.main_thread():
+            raise RuntimeError('SIGPROF is only handled in the main thread')
+        with SignalSampler.lock:
+            if SignalSampler.active is not None:
+                raise RuntimeError('A sampler is already running')
+            SignalSampler.active = self
+        signal.signal(signal.SIGPROF, self.handle)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        timer = threading.Timer(self.seconds, self.finish)
+        timer.daemon = True
+        timer.start()
+
+    def handle(self, signum, frame):
+        if SignalSampler.active is self:
+            self.stacks[collapse(frame)] += 1
+
+    def finish(self):
+        # The handler stays installed: it can only be replaced from the
+        # main thread, and without the timer no SIGPROF arrives.
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        SignalSampler.active = None
+        try:
+            save_profile(
+                'sampler', f'pid {os.getpid()}', self, self.seconds,
+                profile_id=self.profile_id,
+            )
+        except RedisError:
+            logger.exception('Could not save profile %s', self.profile_id)
+
+    def dump(self):
+        return render_collapsed(self.stacks)
+
+
+def save_profile(kind, target, profiler, duration, profile_id=None):
+    profile_id = profile_id or uuid.uuid4().hex
+    meta = {
+        'id': profile_id,
+        'kind': kind,
+        'target': target,
+        'format': profiler.format,
+        'duration': round(duration, 3),
+        'created': datetime.now(timezone.utc).isoformat(),
+    }
+    key = profile_key(profile_id)
+    with Redis().raw.pipeline() as pipe:
+        pipe.hset(key, mapping={
+            'format': profiler.format, 'data': profiler.dump()
+        })
+        pipe.expire(key, PROFILE_TTL)
+        pipe.lpush(INDEX_KEY, dumps(meta))
+        pipe.ltrim(INDEX_KEY, 0, PROFILE_LIMIT - 1)
+        pipe.execute()
+    return profile_id
+
+
+def claim_task_profile(task_name):
+    """Uses up one of the profiles armed for the task, if any."""
+    client = Redis().redis
+    key = task_profile_key(task_name)
+    try:
+        if client.get(key) is None:
+            return False
+        return client.decr(key) >= 0
+    except RedisError:
+        return False
+
+
+task_profilers = {}
+
+
+def start_task_profile(task_id, task_name):
+    if claim_task_profile(task_name):
+        profiler = ThreadSampler()
+        profiler.__enter__()
+        task_profilers[task_id] = (profiler, time.perf_counter())
+
+
+def finish_task_profile(task_id, task_name):
+    profiler, started = task_profilers.pop(task_id, (None, None))
+    if profiler is None:
+        return
+    profiler.__exit__(None, None, None)
+    try:
+        save_profile(
+            'task', task_name, profiler, time.perf_counter() - started
+        )
+    except RedisError:
+        pass
+
+
+def is_authorized(request):
+    token = settings.PROFILING_TOKEN
+    supplied = request.headers.get('X-Profile') or request.GET.get('profile')
+    return bool(token and supplied) and compare_digest(
+        supplied.encode(), token.encode()
+    )
+
+
+class ProfilingMiddleware:
+    """Profiles requests that carry the token.
+
+    Under ASGI a sync view runs in the request's own executor thread
+    rather than on the event loop. The sampler follows both threads, so
+    other requests on the same loop show up too; cProfile is enabled in
+    the executor thread and so does not see async views.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not is_authorized(request):
+            return self.get_response(request)
+        profiler = self.get_profiler(request)
+        started = time.perf_counter()
+        with profiler:
+            response = self.get_response(request)
+        return self.save(request, response, profiler, started)
+
+    async def __acall__(self, request):
+        if not is_authorized(request):
+            return await self.get_response(request)
+        # Within a request, sync_to_async always picks the same thread.
+        view_thread_id = await sync_to_async(threading.get_ident)()
+        profiler_class = self.get_profiler_class(request)
+        started = time.perf_counter()
+        if profiler_class is CProfileProfiler:
+            profiler = CProfileProfiler()
+            await sync_to_async(profiler.__enter__)()
+            try:
+                response = await self.get_response(request)
+            finally:
+                await sync_to_async(profiler.__exit__)(None, None, None)
+        else:
+            profiler = profiler_class(
+                thread_ids=[threading.get_ident(), view_thread_id]
+            )
+            with profiler:
+                response = await self.get_response(request)
+        return await sync_to_async(self.save)(
+            request, response, profiler, started
+        )
+
+    def get_profiler_class(self, request):
+        mode = (
+            request.headers.get('X-Profile-Mode')
+            or request.GET.get('profile_mode')
+        )
+        return PROFILERS.get(mode, ThreadSampler)
+
+    def get_profiler(self, request):
+        return self.get_profiler_class(request)()
+
+    def save(self, request, response, profiler, started):
+        try:
+            response['X-Profile-Id'] = save_profile(
+                'request', f'{request.method} {get_view_name(request)}',
+                profiler, time.perf_counter() - started,
+            )
+        except RedisError:
+            pass
+        return response
+
+
+def token_required(view):
+    def wrapper(request, *args, **kwargs):
+        if not is_authorized(request):
+            return HttpResponse(status=404)
+        return view(request, *args, **kwargs)
+    return csrf_exempt(wrapper)
+
+
+def get_int(request, name, default, maximum):
+    try:
+        return min(max(int(request.GET.get(name, default)), 1), maximum)
+    except ValueError:
+        return default
+
+
+@token_required
+@require_GET
+def profile_list(request):
+    client = Redis().raw
+    profiles = [loads(item) for item in client.lrange(INDEX_KEY, 0, -1)]
+    with client.pipeline(transaction=False) as pipe:
+        for profile in profiles:
+            pipe.exists(profile_key(profile['id']))
+        alive = pipe.execute()
+    return JsonResponse(
+        [profile for profile, exists in zip(profiles, alive) if exists],
+        safe=False,
+    )
+
+
+@token_required
+@require_GET
+def profile_download(request, profile_id):
+    profile_format, data = Redis().raw.hmget(
+        profile_key(profile_id), 'format', 'data'
+    )
+    if data is None:
+        return HttpResponse(status=404)
+    if profile_format == b'pstats':
+        extension, content_type = 'pstats', 'application/octet-stream'
+    else:
+        extension, content_type = 'collapsed.txt', 'text/plain'
+    response = HttpResponse(data, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="{profile_id}.{extension}"'
+    )
+    return response
+
+
+@token_required
+@require_POST
+def start_sampler(request):
+    seconds = get_int(request, 'seconds', 30, MAX_SAMPLER_SECONDS)
+    sampler = SignalSampler(uuid.uuid4().hex, seconds)
+    try:
+        sampler.start()
+    except RuntimeError as error:
+        return JsonResponse({'detail': str(error)}, status=409)
+    return JsonResponse(
+        {'id': sampler.profile_id, 'pid': os.getpid(), 'seconds': seconds},
+        status=202,
+    )
+
+
+@token_required
+@require_POST
+def arm_task_profile(request):
+    task_name = request.GET.get('task', '')
+    if not task_name.startswith('api.tasks.'):
+        return JsonResponse(
+            {'detail': 'Only api.tasks.* can be profiled'}, status=400
+        )
+    count = get_int(request, 'count', 1, MAX_TASK_PROFILES)
+    Redis().redis.set(task_profile_key(task_name), count, ex=PROFILE_TTL)
+    return JsonResponse({'task': task_name, 'count': count}, status=202)
@@ -1,29 +1,121 @@
+import asyncio
 import sys
 import redis
+import redis.asyncio
 import json
+import logging
 import os
+import time
+import zlib
+
+import orjson
+
+from services.metrics import atimed_redis, timed_redis
 
 sys.path.insert(0, '/app')
 
 from redis.commands.search.field import TextField, TagField
 from redis.commands.search.index_definition import IndexDefinition, IndexType
 
+logger = logging.getLogger(__name__)
+
+COMPRESS_THRESHOLD = 1024
+RAW_PREFIX = b'j'
+COMPRESSED_PREFIX = b'z'
+LOCK_TIMEOUT = 30
+LOCK_POLL_INTERVAL = 0.05
+
+
+def get_pool_kwargs():
+    return {
+        "host": os.getenv("APP_REDIS_HOST"),
+        "port": int(os.getenv("APP_REDIS_PORT")),
+        "max_connections": int(os.getenv("APP_REDIS_MAX_CONNECTIONS", 50)),
+        "socket_timeout": float(os.getenv("APP_REDIS_SOCKET_TIMEOUT", 1.0)),
+        "socket_connect_timeout": float(
+            os.getenv("APP_REDIS_CONNECT_TIMEOUT", 1.0)
+        ),
+        "health_check_interval": 30,
+    }
+
+
+def get_pubsub_pool_kwargs():
+    return {
+        **get_pool_kwargs(),
+        "max_connections": int(
+            os.getenv("APP_REDIS_PUBSUB_MAX_CONNECTIONS", 500)
+        ),
+        "socket_timeout": None,
+    }
+
+
+def dumps(value):
+    data = orjson.dumps(value, default=str)
+    if len(data) > COMPRESS_THRESHOLD:
+        return COMPRESSED_PREFIX + zlib.compress(data, 1)
+    return RAW_PREFIX + data
+
+
+def loads(data):
+    if data is None:
+        return None
+    prefix, payload = data[:1], data[1:]
+    if prefix == COMPRESSED_PREFIX:
+        return orjson.loads(zlib.decompress(payload))
+    if prefix == RAW_PREFIX:
+        return orjson.loads(payload)
+    return json.loads(data)
+
+
+class TimedRedis(redis.Redis):
+    """Adds the time of every command to the current request's stats."""
+
+    execute_command = timed_redis(redis.Redis.execute_command)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        pipe.execute = timed_redis(pipe.execute)
+        return pipe
+
+
+class TimedAsyncRedis(redis.asyncio.Redis):
+    execute_command = atimed_redis(redis.asyncio.Redis.execute_command)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction, shard_hint)
+        pipe.execute = atimed_redis(pipe.execute)
+        return pipe
+
 
 class Redis:
     _client = None
+    _raw_client = None
+    _pubsub_client = None
+    _index_ready = False
 
     def __init__(self):
         if Redis._client is None:
-            Redis._client = self._create_client()
+            Redis._client = self._create_client(decode_responses=True)
+            Redis._raw_client = self._create_client(decode_responses=False)
+            Redis._pubsub_client = redis.Redis(
+                connection_pool=redis.BlockingConnectionPool(
+                    timeout=1, **get_pubsub_pool_kwargs()
+                )
+            )
 
         self.redis = Redis._client
+        self.raw = Redis._raw_client
+
+    def pubsub(self):
+        return Redis._pubsub_client.pubsub()
 
-    def _create_client(self):
-        return redis.Redis(
-            host=os.getenv("APP_REDIS_HOST"),
-            port=int(os.getenv("APP_REDIS_PORT")),
-            decode_responses=True
+    def _create_client(self, decode_responses):
+        pool = redis.BlockingConnectionPool(
+            decode_responses=decode_responses,
+            timeout=1,
+            **get_pool_kwargs()
         )
+        return TimedRedis(connection_pool=pool)
 
     def create_index(self):
         try:
@@ -39,19 +131,201 @@ class Redis:
                     index_type=IndexType.HASH
                 )
             )
-            print("Redis index created")
-        except Exception as e:
-            print("Index create skipped:", e)
+        except redis.exceptions.ResponseError as error:
+            if "Index already exists" in str(error):
+                return True
+            logger.warning("Could not create idx_docs: %s", error)
+            return False
+        except redis.exceptions.RedisError:
+            logger.warning("Could not create idx_docs", exc_info=True)
+            return False
+        logger.info("Redis index idx_docs created")
+        return True
+
+    def ensure_index(self):
+        # Retried on the next call until the index exists.
+        if not Redis._index_ready:
+            Redis._index_ready = self.create_index()
 
     def make_cache_key(self, prefix, **params):
         parts = [prefix] + [f"{k}:{v}" for k, v in sorted(params.items())]
         return "|".join(parts)
 
     def cache_get(self, key):
-        data = self.redis.get(key)
-        if data:
-            return json.loads(data)
-        return None
+        return loads(self.raw.get(key))
 
     def cache_set(self, key, value, ttl=86400):
-        self.redis.set(key, json.dumps(value), ex=ttl)
\ No newline at end of file
+        self.raw.set(key, dumps(value), ex=ttl)
+
+    def cache_get_many(self, keys):
+        if not keys:
+            return {}
+        return {
+            key: loads(data)
+            for key, data in zip(keys, self.raw.mget(keys))
+            if data is not None
+        }
+
+    def cache_set_many(self, mapping, ttl=86400):
+        pipe = self.raw.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(key, dumps(value), ex=ttl)
+        pipe.execute()
+
+    def get_or_fetch(self, key, fetch, soft_ttl=3600, hard_ttl=86400):
+        """Single-flight read-through cache with stale-while-revalidate.
+
+        Entries are served as-is for ``soft_ttl`` seconds and kept for
+        ``hard_ttl``. Only the holder of ``lock:<key>`` calls ``fetch``,
+        and serves the stale value if it fails; other callers get the
+        stale value or wait for the holder. A waiter that finds nothing
+        cached afterwards raises ``LookupError`` rather than fetching.
+        """
+        entry = self.cache_get(key)
+        if not isinstance(entry, dict) or "fresh_until" not in entry:
+            entry = None
+        if entry and entry["fresh_until"] > time.time():
+            return entry["value"]
+
+        lock = self.redis.lock(f"lock:{key}", timeout=LOCK_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            if entry:
+                return entry["value"]
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while (
+                self.redis.exists(f"lock:{key}")
+                and time.monotonic() < deadline
+            ):
+                time.sleep(LOCK_POLL_INTERVAL)
+            entry = self.cache_get(key)
+            if isinstance(entry, dict) and "value" in entry:
+                return entry["value"]
+            raise LookupError(f"{key} was not filled by the lock holder")
+
+        try:
+            try:
+                value = fetch()
+            except Exception:
+                if entry:
+                    return entry["value"]
+                raise
+            self.cache_set(
+                key,
+                {"value": value, "fresh_until": time.time() + soft_ttl},
+                ttl=hard_ttl
+            )
+            return value
+        finally:
+            try:
+                lock.release()
+            except redis.exceptions.LockError:
+                # fetch() outlived LOCK_TIMEOUT and the lock expired; the
+                # value is still good.
+                logger.warning("Lock on %s expired during fetch", key)
+
+    def get_versions(self, *resources):
+        keys = [f"version:{resource}" for resource in resources]
+        values = self.redis.mget(keys)
+        return {
+            resource: int(value or 0)
+            for resource, value in zip(resources, values)
+        }
+
+    def get_versioned(self, key, resources):
+        version_keys = [f"version:{resource}" for resource in resources]
+        *versions, data = self.raw.mget(version_keys + [key])
+        return (
+            {
+                resource: int(value or 0)
+                for resource, value in zip(resources, versions)
+            },
+            loads(data),
+        )
+
+    def bump_version(self, resource):
+        return self.redis.incr(f"version:{resource}")
+
+
+class AsyncRedis:
+    """``redis.asyncio`` clients of the running event loop.
+
+    Connections belong to the loop that opened them, and ``async_to_sync``
+    (an async view served over WSGI) runs every call on a loop of its own
+    that is closed afterwards, so each loop gets its own pools.
+    """
+
+    _clients = {}
+
+    @property
+    def raw(self):
+        return self._get_clients()[0]
+
+    def pubsub(self):
+        return self._get_clients()[1].pubsub()
+
+    @classmethod
+    def _get_clients(cls):
+        loop = asyncio.get_running_loop()
+        entry = cls._clients.get(id(loop))
+        if entry is None or entry[0] is not loop:
+            for key, (other_loop, *_) in list(cls._clients.items()):
+                if other_loop.is_closed():
+                    cls._clients.pop(key, None)
+            entry = cls._clients[id(loop)] = (loop, *cls._create_clients())
+        return entry[1:]
+
+    @staticmethod
+    def _create_clients():
+        client = TimedAsyncRedis(
+            connection_pool=redis.asyncio.BlockingConnectionPool(
+                timeout=1, **get_pool_kwargs()
+            )
+        )
+        # Subscribers hold a connection for minutes; a pool of their own
+        # keeps open streams from starving cache reads.
+        pubsub_client = redis.asyncio.Redis(
+            connection_pool=redis.asyncio.BlockingConnectionPool(
+                timeout=1, **get_pubsub_pool_kwargs()
+            )
+        )
+        return client, pubsub_client
+
+    async def cache_get(self, key):
+        return loads(await self.raw.get(key))
+
+    async def cache_set(self, key, value, ttl=86400):
+        await self.raw.set(key, dumps(value), ex=ttl)
+
+    async def cache_get_many(self, keys):
+        if not keys:
+            return {}
+        return {
+            key: loads(data)
+            for key, data in zip(keys, await self.raw.mget(keys))
+            if data is not None
+        }
+
+    async def cache_set_many(self, mapping, ttl=86400):
+        async with self.raw.pipeline(transaction=False) as pipe:
+            for key, value in mapping.items():
+                pipe.set(key, dumps(value), ex=ttl)
+            await pipe.execute()
+
+    async def get_versions(self, *resources):
+        keys = [f"version:{resource}" for resource in resources]
+        values = await self.raw.mget(keys)
+        return {
+            resource: int(value or 0)
+            for resource, value in zip(resources, values)
+        }
+
+    async def get_versioned(self, key, resources):
+        version_keys = [f"version:{resource}" for resource in resources]
+        *versions, data = await self.raw.mget(version_keys + [key])
+        return (
+            {
+                resource: int(value or 0)
+                for resource, value in zip(resources, versions)
+            },
+            loads(data),
+        )
@@ -0,0 +1,68 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores each file once, under the SHA-256 of its content.
+
+    Blobs may be shared by several rows, so ``delete`` is a no-op and
+    unreferenced blobs are removed by ``collect_media_garbage``.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        full_directory = self.path(directory)
+        os.makedirs(full_directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        with tempfile.NamedTemporaryFile(
+            dir=full_directory, delete=False
+        ) as temp_file:
+            try:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+            except BaseException:
+                os.unlink(temp_file.name)
+                raise
+
+        hexdigest = digest.hexdigest()
+        blob_name = os.path.join(
+            directory, hexdigest[:2], f'{hexdigest}{extension}'
+        ).replace('\\', '/')
+        blob_path = self.path(blob_name)
+        if os.path.exists(blob_path):
+            try:
+                # A fresh mtime keeps the shared blob out of
+                # collect_media_garbage until the new row is committed.
+                os.utime(blob_path)
+            except FileNotFoundError:
+                pass
+            else:
+                os.unlink(temp_file.name)
+                return blob_name
+
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(temp_file.name, self.file_permissions_mode)
+        os.replace(temp_file.name, blob_path)
+        return blob_name
+
+    def delete(self, name):
+        pass
+
+    def delete_blob(self, name):
+        super().delete(name)
@@ -66,6 +66,25 @@ class User(AbstractUser):
         verbose_name='Аватарка'
     )
 
+    avatar_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Варианты аватарки',
+    )
+
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов',
+    )
+
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков',
+    )
+
     USERNAME_FIELD = 'email'
 
     REQUIRED_FIELDS = [
@@ -104,6 +123,11 @@ class Subscription(models.Model):
                 fields=['user', 'author'], name='unique_follow'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='subscription_author_user'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user} {self.author}'
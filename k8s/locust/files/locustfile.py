@@ -1,12 +1,61 @@
-from random import randint
+import itertools
+import json
+import os
+from random import choice, randint, sample
 
-from locust import HttpUser, between, task
+from locust import HttpUser, between, events, task
+from locust.runners import WorkerRunner
 
 
 DEFAULT_HEADERS = {"Host": "foodgram.localhost.ru"}
 
+# Users created by `python manage.py seed_dataset`. Tokens are read from
+# LOCUST_TOKENS_FILE (written by --tokens-file) or obtained by logging in.
+LOADTEST_PREFIX = os.getenv("LOADTEST_PREFIX", "loadtest")
+LOADTEST_USERS = int(os.getenv("LOADTEST_USERS", 1000))
+LOADTEST_PASSWORD = os.getenv("LOADTEST_PASSWORD", "loadtest-password")
+TOKENS_FILE = os.getenv("LOCUST_TOKENS_FILE")
+RESULTS_FILE = os.getenv("LOCUST_RESULTS_FILE", "results.json")
+BASELINE_FILE = os.getenv("LOCUST_BASELINE_FILE", "baseline.json")
+REGRESSION_PCT = float(os.getenv("LOCUST_REGRESSION_PCT", 20))
+PERCENTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+
+PIXEL_PNG = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA"
+    "DUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg=="
+)
+
+
+class TokenPool:
+    def __init__(self):
+        self.tokens = []
+        if TOKENS_FILE:
+            with open(TOKENS_FILE, encoding="utf-8") as file:
+                self.tokens = json.load(file)
+        self.logins = itertools.cycle(range(LOADTEST_USERS))
+        self.cycle = itertools.cycle(self.tokens) if self.tokens else None
+
+    def acquire(self, client):
+        if self.cycle is not None:
+            return next(self.cycle)
+        number = next(self.logins)
+        response = client.post(
+            "/api/auth/token/login/",
+            json={
+                "email": f"{LOADTEST_PREFIX}{number}@example.com",
+                "password": LOADTEST_PASSWORD,
+            },
+            headers=DEFAULT_HEADERS,
+            name="/api/auth/token/login/",
+        )
+        return response.json()["auth_token"]
+
+
+token_pool = TokenPool()
+
 
 class FoodgramReadOnlyUser(HttpUser):
+    weight = 3
     wait_time = between(0.5, 2.0)
 
     @task(5)
@@ -41,3 +90,204 @@ class FoodgramReadOnlyUser(HttpUser):
             headers=DEFAULT_HEADERS,
             name="/api/recipes/[id]/",
         )
+
+
+class AuthenticatedUser(HttpUser):
+    abstract = True
+
+    def on_start(self):
+        self.headers = {
+            **DEFAULT_HEADERS,
+            "Authorization": f"Token {token_pool.acquire(self.client)}",
+        }
+        response = self.client.get(
+            f"/api/recipes/?page={randint(1, 20)}&limit=50",
+            headers=self.headers,
+            name="/api/recipes/ [warmup]",
+        )
+        self.recipe_ids = [
+            recipe["id"] for recipe in response.json().get("results", [])
+        ] or list(range(1, 21))
+        self.author_ids = list({
+            recipe["author"]["id"]
+            for recipe in response.json().get("results", [])
+        })
+
+
+class FoodgramBrowsingUser(AuthenticatedUser):
+    weight = 5
+    wait_time = between(0.5, 2.0)
+
+    @task(6)
+    def recipes(self):
+        self.client.get(
+            f"/api/recipes/?page={randint(1, 10)}&limit=6",
+            headers=self.headers,
+            name="/api/recipes/ [auth]",
+        )
+
+    @task(3)
+    def recipe_detail(self):
+        self.client.get(
+            f"/api/recipes/{choice(self.recipe_ids)}/",
+            headers=self.headers,
+            name="/api/recipes/[id]/ [auth]",
+        )
+
+    @task(2)
+    def favorited(self):
+        self.client.get(
+            "/api/recipes/?is_favorited=1&limit=6",
+            headers=self.headers,
+            name="/api/recipes/?is_favorited",
+        )
+
+    @task(1)
+    def in_shopping_cart(self):
+        self.client.get(
+            "/api/recipes/?is_in_shopping_cart=1&limit=6",
+            headers=self.headers,
+            name="/api/recipes/?is_in_shopping_cart",
+        )
+
+    @task(2)
+    def subscriptions(self):
+        self.client.get(
+            "/api/users/subscriptions/?limit=6&recipes_limit=3",
+            headers=self.headers,
+            name="/api/users/subscriptions/",
+        )
+
+    @task(2)
+    def ingredient_search(self):
+        self.client.get(
+            f"/api/ingredients/?name={choice('абвгдкмпс')}",
+            headers=self.headers,
+            name="/api/ingredients/?name",
+        )
+
+
+class FoodgramActiveUser(AuthenticatedUser):
+    weight = 2
+    wait_time = between(1.0, 3.0)
+
+    def on_start(self):
+        super().on_start()
+        response = self.client.get(
+            f"/api/ingredients/?name={LOADTEST_PREFIX}",
+            headers=self.headers,
+            name="/api/ingredients/?name",
+        )
+        self.ingredient_ids = [
+            ingredient["id"] for ingredient in response.json()
+        ] or [1, 2, 3]
+
+    def toggle(self, path, name):
+        self.client.post(path, headers=self.headers, name=f"POST {name}")
+        self.client.delete(path, headers=self.headers, name=f"DELETE {name}")
+
+    @task(4)
+    def toggle_favorite(self):
+        self.toggle(
+            f"/api/recipes/{choice(self.recipe_ids)}/favorite/",
+            "/api/recipes/[id]/favorite/",
+        )
+
+    @task(4)
+    def toggle_shopping_cart(self):
+        self.toggle(
+            f"/api/recipes/{choice(self.recipe_ids)}/shopping_cart/",
+            "/api/recipes/[id]/shopping_cart/",
+        )
+
+    @task(2)
+    def toggle_subscription(self):
+        if self.author_ids:
+            self.toggle(
+                f"/api/users/{choice(self.author_ids)}/subscribe/",
+                "/api/users/[id]/subscribe/",
+            )
+
+    @task(2)
+    def download_shopping_cart(self):
+        self.client.get(
+            "/api/recipes/download_shopping_cart/",
+            headers=self.headers,
+            name="/api/recipes/download_shopping_cart/",
+        )
+
+    @task(1)
+    def create_recipe(self):
+        ingredients = sample(
+            self.ingredient_ids, min(3, len(self.ingredient_ids))
+        )
+        response = self.client.post(
+            "/api/recipes/",
+            json={
+                "name": "Нагрузочный рецепт",
+                "text": "Создан нагрузочным тестом",
+                "cooking_time": randint(5, 120),
+                "image": PIXEL_PNG,
+                "ingredients": [
+                    {"id": ingredient_id, "amount": randint(1, 500)}
+                    for ingredient_id in ingredients
+                ],
+            },
+            headers=self.headers,
+            name="POST /api/recipes/",
+        )
+        if response.status_code == 201:
+            self.client.delete(
+                f"/api/recipes/{response.json()['id']}/",
+                headers=self.headers,
+                name="DELETE /api/recipes/[id]/",
+            )
+
+
+def collect_percentiles(stats):
+    results = {}
+    for entry in stats.entries.values():
+        if not entry.num_requests:
+            continue
+        results[f"{entry.method} {entry.name}"] = {
+            "requests": entry.num_requests,
+            "failures": entry.num_failures,
+            **{
+                label: entry.get_response_time_percentile(percentile)
+                for label, percentile in PERCENTILES.items()
+            },
+        }
+    return results
+
+
+@events.quitting.add_listener
+def export_results(environment, **kwargs):
+    if isinstance(environment.runner, WorkerRunner):
+        return
+    results = collect_percentiles(environment.stats)
+    with open(RESULTS_FILE, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+
+    if not os.path.exists(BASELINE_FILE):
+        print(f"No baseline at {BASELINE_FILE}; copy {RESULTS_FILE} there")
+        return
+    with open(BASELINE_FILE, encoding="utf-8") as file:
+        baseline = json.load(file)
+
+    regressions = 0
+    print(f"{'endpoint':<50}{'p50':>14}{'p95':>14}{'p99':>14}")
+    for endpoint, current in sorted(results.items()):
+        before = baseline.get(endpoint)
+        cells = []
+        for label in PERCENTILES:
+            if not before or not before.get(label):
+                cells.append(f"{current[label]:>8.0f}   new")
+                continue
+            change = (current[label] / before[label] - 1) * 100
+            if label != "p50" and change > REGRESSION_PCT:
+                regressions += 1
+            cells.append(f"{current[label]:>8.0f}{change:>+5.0f}%")
+        print(f"{endpoint:<50}" + "".join(f"{cell:>14}" for cell in cells))
+    if regressions:
+        print(f"{regressions} percentile(s) regressed by >{REGRESSION_PCT}%")
+        environment.process_exit_code = 1
@@ -1,61 +1,192 @@
+import argparse
 import pika
 import json
 import requests
-import sys
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from requests.adapters import HTTPAdapter
 from vault_helper import vault_helper
 
+RABBITMQ_HOST = 'rabbitmq.foodgram.localhost.ru'
+WEATHER_URL = "http://api.weatherapi.com/v1/current.json"
+FOOD_URL = "https://api.spoonacular.com/recipes/complexSearch"
+REQUEST_TIMEOUT = (3.05, 10)
+PREFETCH_COUNT = 32
+WORKERS = 8
+BATCH_TIMEOUT = 0.2
+EVENTS_POLL_INTERVAL = 0.05
+DATA_DIR = Path("data")
+
+
+def make_session(pool_size=WORKERS):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+session = make_session()
+
 
 def weather_callback(api_key, **params):
-    resp = requests.get(
-        url="http://api.weatherapi.com/v1/current.json",
+    resp = session.get(
+        url=WEATHER_URL,
         params={
             "key": api_key,
             **params
-        }
+        },
+        timeout=REQUEST_TIMEOUT
     )
 
     return resp.json()
 
+
 def food_callback(api_key, **params):
-    resp = requests.get(
-        url="https://api.spoonacular.com/recipes/complexSearch",
+    resp = session.get(
+        url=FOOD_URL,
         params={
             "apiKey": api_key,
             **params
-        }
+        },
+        timeout=REQUEST_TIMEOUT
     )
 
     return resp.json()
 
+
 CALLBACK_DICT = {
     'weather': weather_callback,
     'food': food_callback
 }
 
-def message_callback(ch, method, properties, body):
+
+def handle_message(body):
     json_data = json.loads(body)
     alias = json_data.pop('alias')
     api_key = vault_helper.get_api_key(alias)
     api_callback = CALLBACK_DICT.get(alias, weather_callback)
-    api_data = api_callback(api_key, **json_data)
-    file_path = Path("data") / f"{alias}.json"
-    with file_path.open('w') as f:
-        json.dump(obj=api_data, fp=f, ensure_ascii=False, indent=2)
-    ch.basic_ack(delivery_tag = method.delivery_tag)
+    return alias, api_callback(api_key, **json_data)
+
+
+class JsonLinesWriter:
+    """Appends one line per message to data/<alias>.jsonl."""
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = Path(data_dir)
+        self.files = {}
+
+    def write(self, alias, api_data):
+        if alias not in self.files:
+            self.data_dir.mkdir(parents=True, exist_ok=True)
+            self.files[alias] = (self.data_dir / f"{alias}.jsonl").open('a')
+        file = self.files[alias]
+        file.write(json.dumps(api_data, ensure_ascii=False) + '\n')
+        file.flush()
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+
+
+class FilePerMessageWriter:
+    """Writes each message to its own data/<alias>/<uuid>.json."""
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = Path(data_dir)
+
+    def write(self, alias, api_data):
+        directory = self.data_dir / alias
+        directory.mkdir(parents=True, exist_ok=True)
+        with (directory / f"{uuid.uuid4()}.json").open('w') as f:
+            json.dump(obj=api_data, fp=f, ensure_ascii=False, indent=2)
+
+    def close(self):
+        pass
+
+
+WRITERS = {
+    'jsonl': JsonLinesWriter,
+    'files': FilePerMessageWriter,
+}
+
+
+def process_batch(channel, executor, handler, writer, batch):
+    futures = [
+        (method, executor.submit(handler, body)) for method, body in batch
+    ]
+    # Results are written and acknowledged from this thread only: pika
+    # channels and the output files are not shared with the workers.
+    for method, future in futures:
+        # Keep servicing the connection while the batch runs, otherwise a
+        # slow upstream makes the broker miss heartbeats and drop us.
+        while not future.done():
+            channel.connection.process_data_events(
+                time_limit=EVENTS_POLL_INTERVAL
+            )
+        try:
+            alias, api_data = future.result()
+        except Exception as error:
+            print(f"Message {method.delivery_tag} failed: {error!r}")
+            channel.basic_nack(
+                delivery_tag=method.delivery_tag,
+                requeue=not method.redelivered
+            )
+            continue
+        writer.write(alias, api_data)
+        channel.basic_ack(delivery_tag=method.delivery_tag)
+
+
+def consume(channel, queue_name, handler=handle_message, writer=None,
+            workers=WORKERS, prefetch_count=PREFETCH_COUNT,
+            batch_timeout=BATCH_TIMEOUT, limit=None):
+    writer = writer or JsonLinesWriter()
+    channel.basic_qos(prefetch_count=prefetch_count)
+    processed = 0
+    batch = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for method, _, body in channel.consume(
+                queue=queue_name, inactivity_timeout=batch_timeout
+            ):
+                if method is not None:
+                    batch.append((method, body))
+                    if len(batch) < prefetch_count:
+                        continue
+                if batch:
+                    process_batch(channel, executor, handler, writer, batch)
+                    processed += len(batch)
+                    batch = []
+                if limit is not None and processed >= limit:
+                    break
+        finally:
+            channel.cancel()
+            writer.close()
+    return processed
+
 
 def main():
-    api_alias = sys.argv[1:][0]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('alias')
+    parser.add_argument('--prefetch', type=int, default=PREFETCH_COUNT)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--output', choices=WRITERS, default='jsonl')
+    args = parser.parse_args()
+    api_alias = args.alias
+
+    global session
+    session = make_session(args.workers)
 
     vault_credentials = vault_helper.get_rabbitmq_credentials()
 
     credentials = pika.PlainCredentials(
         **vault_credentials
-    ) 
+    )
 
     connection = pika.BlockingConnection(
         pika.ConnectionParameters(
-            host='rabbitmq.foodgram.localhost.ru',
+            host=RABBITMQ_HOST,
             credentials=credentials
         )
     )
@@ -73,13 +204,14 @@ def main():
         routing_key=api_alias
     )
 
-    channel.basic_consume(
-        queue=queue_name,
-        on_message_callback=message_callback
+    consume(
+        channel,
+        queue_name,
+        writer=WRITERS[args.output](),
+        workers=args.workers,
+        prefetch_count=args.prefetch
     )
 
-    channel.start_consuming()
-
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
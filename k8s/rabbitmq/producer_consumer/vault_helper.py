@@ -1,39 +1,93 @@
 import requests
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
+SECRETS_TTL = 300
+# Log in again this many seconds before Vault expires the token.
+TOKEN_EXPIRY_MARGIN = 30
+
 class VaultHelper:
-    def __init__(self):
+    def __init__(self, secrets_ttl=SECRETS_TTL):
         load_dotenv('./.env')
         self.__vault_addr = os.getenv('VAULT_ADDR')
         print(self.__vault_addr)
-        self.__token = self.__get_client_token()
+        self.__session = requests.Session()
+        self.__token = None
+        self.__token_expires = 0
+        self.__secrets_ttl = secrets_ttl
+        self.__cache = {}
+        self.__lock = threading.Lock()
+        self.__fetch_lock = threading.Lock()
 
     def __get_client_token(self):
-        resp = requests.post(
+        resp = self.__session.post(
             url=f"{self.__vault_addr}/v1/auth/approle/login",
             json={
                 "role_id": os.getenv("VAULT_ROLE_ID"),
                 "secret_id": os.getenv("VAULT_SECRET_ID"),
-            }
+            },
+            timeout=10
         )
+        resp.raise_for_status()
 
-        json_data = resp.json()
-        return json_data["auth"]["client_token"]
-    
-    def __get_secrets(self, secret_path):
-        resp = requests.get(
+        auth = resp.json()["auth"]
+        self.__token = auth["client_token"]
+        # A lease_duration of 0 means the token does not expire.
+        lease = auth.get("lease_duration") or 0
+        self.__token_expires = (
+            time.monotonic() + lease - TOKEN_EXPIRY_MARGIN
+            if lease else float('inf')
+        )
+
+    def __read_secrets(self, secret_path):
+        return self.__session.get(
             url=f"{self.__vault_addr}/v1/secrets/data/{secret_path}",
             headers={
                 'X-Vault-Token': self.__token
-            }
+            },
+            timeout=10
         )
 
+    def __fetch_secrets(self, secret_path):
+        if self.__token is None or self.__token_expires <= time.monotonic():
+            self.__get_client_token()
+        resp = self.__read_secrets(secret_path)
+        if resp.status_code == 403:
+            # Revoked or expired ahead of its lease: log in again once.
+            self.__get_client_token()
+            resp = self.__read_secrets(secret_path)
+        resp.raise_for_status()
+
         json_data = resp.json()
-        data = json_data['data']['data']
-        print(data)
-        return data
-    
+        return json_data['data']['data']
+
+    def __get_secrets(self, secret_path):
+        # Secrets are cached for secrets_ttl seconds so consumers do not
+        # call Vault once per message. A single thread refreshes them,
+        # without holding the cache lock, and the others keep using the
+        # stale copy meanwhile; they only wait when there is none yet.
+        with self.__lock:
+            cached = self.__cache.get(secret_path)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+        if not self.__fetch_lock.acquire(blocking=cached is None):
+            return cached[1]
+        try:
+            with self.__lock:
+                cached = self.__cache.get(secret_path)
+            if cached is None or cached[0] <= time.monotonic():
+                cached = (
+                    time.monotonic() + self.__secrets_ttl,
+                    self.__fetch_secrets(secret_path)
+                )
+                with self.__lock:
+                    self.__cache[secret_path] = cached
+            return cached[1]
+        finally:
+            self.__fetch_lock.release()
+
     def get_rabbitmq_credentials(self):
         return self.__get_secrets("rabbitmq")
     
@@ -42,4 +96,4 @@ class VaultHelper:
         return api_data[alias]
     
 
-vault_helper = VaultHelper()
\ No newline at end of file
+vault_helper = VaultHelper()
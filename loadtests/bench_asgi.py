@@ -0,0 +1,183 @@
+"""Compare the WSGI and ASGI read paths at equal CPU.
+
+Needs the usual Postgres and Redis (seed them with ``manage.py
+seed_dataset --tokens-file tokens.json``) and runs gunicorn from
+``backend/`` twice: ``SERVER_MODE=wsgi`` (sync workers, DRF views) and
+``SERVER_MODE=asgi`` (uvicorn workers, ``api.async_views``). Both get
+the same worker count and are pinned to the same CPUs with ``taskset``;
+the load generator is pinned to the remaining ones.
+
+    python bench_asgi.py --cpus 0-1 --workers 2 --tokens-file tokens.json
+
+Pass a token to measure the uncached path: anonymous list and detail
+responses are mostly served from the Redis response cache.
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+HOST_HEADER = "foodgram.localhost.ru"
+
+
+def parse_cpus(spec):
+    cpus = set()
+    for part in spec.split(","):
+        first, _, last = part.partition("-")
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def start_server(mode, port, workers, cpus):
+    env = {
+        **os.environ,
+        "SERVER_MODE": mode,
+        "WEB_CONCURRENCY": str(workers),
+    }
+    process = subprocess.Popen(
+        [
+            "taskset", "-c", ",".join(map(str, sorted(cpus))),
+            "gunicorn", "--bind", f"127.0.0.1:{port}",
+            "--log-level", "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            request("127.0.0.1", port, "/metrics", {})
+            return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    sys.exit(f"{mode} server did not start on port {port}")
+
+
+def request(host, port, path, headers, connection=None):
+    connection = connection or http.client.HTTPConnection(
+        host, port, timeout=30
+    )
+    connection.request("GET", path, headers={"Host": HOST_HEADER, **headers})
+    response = connection.getresponse()
+    body = response.read()
+    if response.getheader("Connection", "").lower() == "close":
+        connection.close()
+    return response.status, body
+
+
+def run_load(port, path, headers, concurrency, duration):
+    timings = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        local_timings, local_errors = [], 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                status, _ = request(
+                    "127.0.0.1", port, path, headers, connection
+                )
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status = None
+            local_timings.append(time.perf_counter() - started)
+            if status != 200:
+                local_errors += 1
+        with lock:
+            timings.extend(local_timings)
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    percentiles = statistics.quantiles(timings, n=100)
+    return {
+        "rps": len(timings) / elapsed,
+        "p50": percentiles[49] * 1000,
+        "p99": percentiles[98] * 1000,
+        "errors": errors[0],
+    }
+
+
+def make_paths(port, headers):
+    _, body = request("127.0.0.1", port, "/api/recipes/?limit=1", headers)
+    recipe_id = json.loads(body)["results"][0]["id"]
+    return {
+        "recipe list": "/api/recipes/?limit=6",
+        "recipe detail": f"/api/recipes/{recipe_id}/",
+        "ingredient autocomplete": "/api/ingredients/?name=%D0%BC&limit=10",
+        "task status": f"/api/task_status/{uuid.uuid4()}/",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cpus", default="0-1",
+                        help="CPUs for the server, e.g. 0-1 or 0,2")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--token", help="Authorization token to send")
+    parser.add_argument(
+        "--tokens-file",
+        help="JSON list written by seed_dataset; first is used",
+    )
+    parser.add_argument("--modes", default="wsgi,asgi")
+    args = parser.parse_args()
+
+    server_cpus = parse_cpus(args.cpus)
+    client_cpus = set(os.sched_getaffinity(0)) - server_cpus
+    if client_cpus:
+        os.sched_setaffinity(0, client_cpus)
+    else:
+        print("warning: no CPUs left for the load generator")
+
+    token = args.token
+    if token is None and args.tokens_file:
+        with open(args.tokens_file, encoding="utf-8") as file:
+            token = json.load(file)[0]
+    headers = {"Authorization": f"Token {token}"} if token else {}
+
+    results = {}
+    for mode in args.modes.split(","):
+        server = start_server(mode, args.port, args.workers, server_cpus)
+        try:
+            paths = make_paths(args.port, headers)
+            for name, path in paths.items():
+                run_load(args.port, path, headers, args.concurrency,
+                         args.warmup)
+                results[name, mode] = run_load(
+                    args.port, path, headers, args.concurrency, args.duration
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{'endpoint':<26}{'mode':<6}{'req/s':>10}{'p50 ms':>10}"
+          f"{'p99 ms':>10}{'errors':>8}")
+    for (name, mode), result in sorted(results.items()):
+        print(f"{name:<26}{mode:<6}{result['rps']:>10.0f}"
+              f"{result['p50']:>10.1f}{result['p99']:>10.1f}"
+              f"{result['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
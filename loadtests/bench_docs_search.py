@@ -0,0 +1,146 @@
+"""Latency benchmark for FT.SEARCH over idx_docs.
+
+Start a local Redis Stack and run:
+
+    docker run --rm -p 6380:6379 redis/redis-stack-server:latest
+    python bench_docs_search.py --port 6380 --docs 300000
+
+The script seeds ``library:``/``bible:`` hashes, builds the same index as
+``services.redis.Redis.create_index`` and reports p50/p95/p99 latency of
+the queries ``/api/docs/search/`` issues. Pass ``--url`` to measure the
+HTTP endpoint instead of Redis directly.
+"""
+import argparse
+import random
+import statistics
+import time
+
+import redis
+from redis.commands.search.field import TagField, TextField
+from redis.commands.search.index_definition import IndexDefinition, IndexType
+from redis.commands.search.query import Query
+
+WORDS = (
+    "adventures river island journey war peace night letter king garden "
+    "light house winter summer stranger sea mountain city story child"
+).split()
+AUTHORS = (
+    "twain tolstoy dickens austen hugo chekhov verne wilde orwell "
+    "hemingway"
+).split()
+PAGE_SIZE = 10
+
+
+def seed(client, count, batch_size=5000):
+    try:
+        client.ft("idx_docs").dropindex(delete_documents=True)
+    except redis.ResponseError:
+        pass
+    client.ft("idx_docs").create_index(
+        fields=[
+            TextField("top_work"),
+            TextField("author"),
+            TextField("verse"),
+            TagField("source"),
+        ],
+        definition=IndexDefinition(
+            prefix=["library:", "bible:"], index_type=IndexType.HASH
+        ),
+    )
+    pipe = client.pipeline(transaction=False)
+    for number in range(count):
+        if number % 4:
+            pipe.hset(f"library:{number}", mapping={
+                "source": "library",
+                "author": f"{random.choice(AUTHORS)} {number}",
+                "top_work": " ".join(random.sample(WORDS, 3)),
+            })
+        else:
+            pipe.hset(f"bible:{number}", mapping={
+                "source": "bible",
+                "verse": " ".join(random.sample(WORDS, 8)),
+            })
+        if number % batch_size == batch_size - 1:
+            pipe.execute()
+    pipe.execute()
+    while int(client.ft("idx_docs").info()["indexing"]):
+        time.sleep(0.5)
+
+
+def make_queries(count):
+    queries = []
+    for _ in range(count):
+        text = random.choice(WORDS + AUTHORS)
+        source = random.choice([None, "library", "bible"])
+        offset = random.choice([0, 0, 0, PAGE_SIZE, PAGE_SIZE * 5])
+        queries.append((text, source, offset))
+    return queries
+
+
+def run_redis(client, queries):
+    timings = []
+    for text, source, offset in queries:
+        query_string = text + (f" @source:{{{source}}}" if source else "")
+        query = Query(query_string).paging(offset, PAGE_SIZE).highlight(
+            ["author", "top_work", "verse"], ["<b>", "</b>"]
+        )
+        started = time.perf_counter()
+        client.ft("idx_docs").search(query)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def run_http(url, queries):
+    import requests
+
+    session = requests.Session()
+    timings = []
+    for text, source, offset in queries:
+        params = {"q": text, "limit": PAGE_SIZE,
+                  "page": offset // PAGE_SIZE + 1}
+        if source:
+            params["source"] = source
+        started = time.perf_counter()
+        session.get(url, params=params, timeout=10).raise_for_status()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def report(timings):
+    percentiles = statistics.quantiles(timings, n=100)
+    print(
+        f"queries={len(timings)} "
+        f"p50={percentiles[49] * 1000:.2f}ms "
+        f"p95={percentiles[94] * 1000:.2f}ms "
+        f"p99={percentiles[98] * 1000:.2f}ms "
+        f"max={max(timings) * 1000:.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6380)
+    parser.add_argument("--docs", type=int, default=300000)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--url", help="e.g. http://localhost/api/docs/search/")
+    args = parser.parse_args()
+
+    client = redis.Redis(host=args.host, port=args.port,
+                         decode_responses=True)
+    if not args.skip_seed:
+        started = time.perf_counter()
+        seed(client, args.docs)
+        print(f"seeded {args.docs} docs in "
+              f"{time.perf_counter() - started:.1f}s")
+
+    queries = make_queries(args.queries)
+    if args.url:
+        report(run_http(args.url, queries))
+    else:
+        report(run_redis(client, queries))
+
+
+if __name__ == "__main__":
+    main()
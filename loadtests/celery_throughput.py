@@ -0,0 +1,110 @@
+"""Celery throughput of the shipped worker profiles.
+
+    pip install -r requirements.txt
+    python celery_throughput.py --tasks 400
+    python celery_throughput.py --broker redis://redis:6379/15
+
+Starts a real ``celery worker`` per profile with the pool, concurrency
+and prefetch options of ``k8s/helm/charts/celery-worker/values.yaml``
+(gevent for "io", prefork with autoscale for "cpu"), then runs an
+I/O-shaped task (sleep, like the external fetches on the "io" queue) and
+a CPU-shaped task (hashing, like image variants on the "cpu" queue)
+through each and prints tasks/s. Running each task on the other profile
+too shows what a wrong route costs.
+
+The workers are separate processes, as gevent has to patch the process
+before Celery is imported, so the broker must be a networked one; it is
+also used as the result backend.
+"""
+import argparse
+import hashlib
+import itertools
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from celery import Celery
+
+IO_DELAY = 0.05
+CPU_ROUNDS = 20000
+# Keep in sync with deployment.workers in the celery-worker chart.
+PROFILES = {
+    "io": ("--pool=gevent", "--concurrency=50", "--prefetch-multiplier=4"),
+    "cpu": ("--pool=prefork", "--autoscale=4,1", "--prefetch-multiplier=1"),
+}
+WARMUP_TASKS = 20
+
+broker_url = os.getenv("BENCH_BROKER_URL", "redis://localhost:6379/15")
+app = Celery("celery_throughput", broker=broker_url, backend=broker_url)
+app.conf.task_acks_late = True
+
+
+@app.task
+def io_task():
+    time.sleep(IO_DELAY)
+
+
+@app.task
+def cpu_task():
+    digest = b""
+    for _ in range(CPU_ROUNDS):
+        digest = hashlib.sha256(digest).digest()
+
+
+def run_tasks(task, count, queue):
+    results = [task.apply_async(queue=queue) for _ in range(count)]
+    for result in results:
+        result.get(timeout=300)
+
+
+def start_worker(profile):
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "celery", "-A", "celery_throughput",
+            "worker", "--queues", f"bench-{profile}",
+            "--hostname", f"bench-{profile}@%h", "--loglevel=ERROR",
+            "--without-gossip", "--without-mingle", *PROFILES[profile],
+        ],
+        cwd=Path(__file__).resolve().parent,
+        env={**os.environ, "BENCH_BROKER_URL": app.conf.broker_url},
+    )
+
+
+def measure(task, count, profile):
+    started = time.perf_counter()
+    run_tasks(task, count, f"bench-{profile}")
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=400)
+    parser.add_argument("--broker", default=broker_url)
+    args = parser.parse_args()
+    app.conf.broker_url = app.conf.result_backend = args.broker
+
+    rates = {}
+    for profile in PROFILES:
+        worker = start_worker(profile)
+        try:
+            # Returns once the pool answers and lets autoscale settle.
+            run_tasks(io_task, WARMUP_TASKS, f"bench-{profile}")
+            for task in (io_task, cpu_task):
+                rates[task, profile] = measure(task, args.tasks, profile)
+        finally:
+            worker.terminate()
+            worker.wait()
+
+    print(f"{'task':<9}{'profile':<9}{'pool options':<58}{'tasks/s':>10}")
+    for task, profile in itertools.product((io_task, cpu_task), PROFILES):
+        print(
+            f"{task.name.rsplit('.', 1)[-1]:<9}{profile:<9}"
+            f"{' '.join(PROFILES[profile]):<58}"
+            f"{rates[task, profile]:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()